@@ -0,0 +1,65 @@
+"""Benchmark building the raw dataframe from scraped rows"""
+import argparse
+import time
+from typing import List
+
+import pandas as pd
+
+from funda_scraper.scrape import FundaScraper
+
+
+def synthetic_rows(n: int, n_cols: int) -> List[List[str]]:
+    """Rows shaped like the output of FundaScraper.scrape_one_link."""
+    return [
+        [f"https://www.funda.nl/koop/amsterdam/huis-{i}-straat-{i}/"]
+        + [f"value {i} {j}" for j in range(1, n_cols)]
+        for i in range(n)
+    ]
+
+
+def build_row_by_row(scraper: FundaScraper, rows: List[List[str]]) -> pd.DataFrame:
+    """The previous approach, kept here as the baseline."""
+    df = pd.DataFrame({key: [] for key in scraper.selectors.keys()})
+    for c in rows:
+        df.loc[len(df)] = c
+    return df
+
+
+def main(sizes: List[int], baseline_max: int) -> None:
+    scraper = FundaScraper(area="amsterdam", want_to="buy")
+    n_cols = len(scraper.selectors.keys())
+
+    print(f"{'rows':>8} {'columnar (s)':>14} {'row by row (s)':>16}")
+    for n in sizes:
+        rows = synthetic_rows(n, n_cols)
+
+        start = time.perf_counter()
+        scraper._build_raw_df(rows)
+        columnar = time.perf_counter() - start
+
+        baseline = "skipped"
+        if n <= baseline_max:
+            start = time.perf_counter()
+            build_row_by_row(scraper, rows)
+            baseline = f"{time.perf_counter() - start:.3f}"
+
+        print(f"{n:>8} {columnar:>14.3f} {baseline:>16}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        help="Specify the numbers of rows to benchmark",
+        default=[100, 1_000, 10_000, 100_000],
+    )
+    parser.add_argument(
+        "--baseline_max",
+        type=int,
+        help="Specify the largest size for which the row-by-row baseline is run",
+        default=1_000,
+    )
+    args = parser.parse_args()
+    main(args.sizes, args.baseline_max)
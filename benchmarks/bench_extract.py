@@ -0,0 +1,55 @@
+"""Benchmark the extraction backends on a listing page"""
+import argparse
+import time
+from pathlib import Path
+
+from funda_scraper.config.core import config
+from funda_scraper.extract import EXTRACTORS, get_extractor, parse_listing
+
+PAGE = Path(__file__).resolve().parent.parent / "tests" / "data" / "listing.html"
+
+
+def main(n: int, padding: int) -> None:
+    html = PAGE.read_text()
+    # Real pages carry a lot of markup around the parts that are scraped
+    filler = "<div class='filler'><p>lorem ipsum</p><a href='#'>link</a></div>" * padding
+    html = html.replace("<footer>", filler + "<footer>")
+    link = "https://www.funda.nl/koop/amsterdam/appartement-43000000-prinsengracht-100/"
+
+    print(f"{'backend':>12} {'single pass':>12} {'partial':>8} {'ms per page':>12}")
+    for backend in EXTRACTORS:
+        if get_extractor(backend).name != backend:
+            print(f"{backend:>12} {'':>12} {'':>8} {'unavailable':>12}")
+            continue
+        for single_pass in (False, True):
+            # Only BeautifulSoup builds a partial tree
+            for partial in (False, True) if backend == "bs4" else (False,):
+                start = time.perf_counter()
+                for _ in range(n):
+                    parse_listing(
+                        html,
+                        link,
+                        config.css_selector.listed_since,
+                        backend,
+                        single_pass,
+                        partial,
+                    )
+                elapsed = (time.perf_counter() - start) / n * 1000
+                print(
+                    f"{backend:>12} {str(single_pass):>12} {str(partial):>8} {elapsed:>12.2f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--n", type=int, help="Specify how many times each page is parsed", default=200
+    )
+    parser.add_argument(
+        "--padding",
+        type=int,
+        help="Specify how many filler blocks are added to the page",
+        default=2_000,
+    )
+    args = parser.parse_args()
+    main(args.n, args.padding)
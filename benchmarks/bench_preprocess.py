@@ -0,0 +1,68 @@
+"""Benchmark cleaning the raw columns cell by cell against the vectorised functions"""
+import argparse
+import time
+from typing import List
+
+import pandas as pd
+
+from funda_scraper import preprocess as pp
+
+FIELDS = {
+    "price": ["€ 500.000 k.k.", "€ 1.250.000 v.o.n.", "€ 1.750 per maand", "Prijs op aanvraag"],
+    "living_area": ["78 m²", "1,234 m²", "52 m²", "104 m²"],
+    "year": ["1900", "1906-1930", "before 1906", "2000"],
+    "num_of_rooms": ["4 kamers (3 slaapkamers)", "2 rooms (1 bedroom)", "1 kamer", "6 kamers"],
+    "num_of_bathrooms": ["1 badkamer en 1 apart toilet", "2 badkamers", "1 bathroom", "na"],
+    "energy_label": ["A++++", "B Wat betekent dit?", "C", "A+"],
+    "date_sold": ["30 juni 2023", "3 weken", "Vandaag", "vrijdag"],
+}
+
+CLEANERS = [
+    ("price", pp.clean_price, pp.clean_price_series),
+    ("living_area", pp.clean_living_area, pp.clean_living_area_series),
+    ("year", pp.clean_year, pp.clean_year_series),
+    ("num_of_rooms", pp.find_n_room, pp.find_n_room_series),
+    ("num_of_rooms", pp.find_n_bedroom, pp.find_n_bedroom_series),
+    ("num_of_bathrooms", pp.find_n_bathroom, pp.find_n_bathroom_series),
+    ("energy_label", pp.clean_energy_label, pp.clean_energy_label_series),
+    ("date_sold", pp.clean_date_format, pp.clean_date_series),
+]
+
+
+def synthetic_df(n: int) -> pd.DataFrame:
+    """Raw columns cycling through a few realistic values."""
+    return pd.DataFrame(
+        {field: [values[i % len(values)] for i in range(n)] for field, values in FIELDS.items()},
+        dtype=object,
+    )
+
+
+def main(sizes: List[int]) -> None:
+    print(f"{'rows':>9} {'apply (s)':>10} {'vectorised (s)':>15}")
+    for n in sizes:
+        df = synthetic_df(n)
+
+        start = time.perf_counter()
+        for field, scalar, _ in CLEANERS:
+            df[field].apply(scalar)
+        applied = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for field, _, vectorised in CLEANERS:
+            vectorised(df[field])
+        vectorised_time = time.perf_counter() - start
+
+        print(f"{n:>9} {applied:>10.3f} {vectorised_time:>15.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        help="Specify the numbers of rows to benchmark",
+        default=[10_000, 100_000, 1_000_000],
+    )
+    args = parser.parse_args()
+    main(args.sizes)
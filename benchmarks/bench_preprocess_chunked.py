@@ -0,0 +1,45 @@
+"""Benchmark cleaning a large raw dataframe at once against in blocks over processes"""
+import argparse
+import os
+import time
+from datetime import datetime
+
+from benchmarks.bench_preprocess_memory import synthetic_raw_df
+from funda_scraper import preprocess as pp
+from funda_scraper.config.core import config
+
+
+def main(n: int, workers, chunk_size: int) -> None:
+    config.dtypes.report = False
+    df = synthetic_raw_df(n)
+    now = datetime(2024, 5, 1)
+    print(f"{n} rows, {os.cpu_count()} cores, blocks of {chunk_size} rows")
+    print(f"{'workers':>8} {'time (s)':>9} {'rows out':>9}")
+    for n_workers in workers:
+        start = time.perf_counter()
+        clean = pp.preprocess_chunked(
+            df, is_past=True, now=now, chunk_size=chunk_size, workers=n_workers
+        )
+        print(f"{n_workers:>8} {time.perf_counter() - start:>9.2f} {len(clean):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--n", type=int, help="Specify the number of rows", default=1_000_000
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        help="Specify the numbers of processes to benchmark, 0 for none",
+        default=[0, 2, 4],
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        help="Specify the number of rows per block",
+        default=100_000,
+    )
+    args = parser.parse_args()
+    main(args.n, args.workers, args.chunk_size)
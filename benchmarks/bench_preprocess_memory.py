@@ -0,0 +1,139 @@
+"""Benchmark the peak memory of preprocess_data against filtering step by step"""
+import argparse
+import gc
+import multiprocessing
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+
+from funda_scraper import preprocess as pp
+from funda_scraper.config.core import config
+from funda_scraper.dtypes import apply_dtype_policy
+
+
+def synthetic_raw_df(n: int) -> pd.DataFrame:
+    """A raw dataframe with the columns of a scrape of sold houses."""
+    values = {
+        "url": [f"https://www.funda.nl/koop/utrecht/appartement-{i}-dummy-{i}/" for i in range(n)],
+        "price": ["€ 500.000 k.k."] * n,
+        "price_sold": ["€ 500.000 k.k.", "Prijs op aanvraag", "€ 425.000 kosten koper"] * (n // 3) + ["€ 1 k.k."] * (n % 3),
+        "descrip": [f"Mooi appartement {i} " * 20 for i in range(n)],
+        "zip_code": ["1111 AA"] * n,
+        "year": ["2000", "1906-1930"] * (n // 2) + ["2000"] * (n % 2),
+        "living_area": ["78 m²", "na", "104 m²", "52 m²"] * (n // 4) + ["78 m²"] * (n % 4),
+        "num_of_rooms": ["4 kamers (3 slaapkamers)"] * n,
+        "num_of_bathrooms": ["1 badkamer en 1 apart toilet"] * n,
+        "energy_label": ["A++++", "B Wat betekent dit?"] * (n // 2) + ["C"] * (n % 2),
+        "building_type": ["Bestaande bouw"] * n,
+        "date_sold": ["30 juni 2023", "na", "3 weken"] * (n // 3) + ["Vandaag"] * (n % 3),
+        "address": ["dummy 10"] * n,
+        "photo": [f"https://cloud.funda.nl/{i}.jpg" for i in range(n)],
+        "city": ["utrecht"] * n,
+    }
+    df = pd.DataFrame(values, dtype=object)
+    # Like the raw dataframe built by the scraper
+    if config.dtypes.enabled:
+        df = apply_dtype_policy(df, report=False)
+    return df
+
+
+def preprocess_step_by_step(df: pd.DataFrame, now: datetime) -> pd.DataFrame:
+    """The previous approach, kept here as the baseline: filter, then write into the copy."""
+    keep_cols = config.keep_cols.selling_data + config.keep_cols.sold_data
+    df = df.dropna()
+    url = df["url"].astype(pp.STRING_DTYPE)
+    df["house_id"] = pp._extract(url, pp.HOUSE_PATTERN, group=2)
+    df["house_type"] = pp._extract(url, pp.HOUSE_PATTERN).astype(object)
+    df = df[df["house_type"].isin(["appartement", "huis"])]
+    df["house_id"] = df["house_id"].astype("int64")
+    df["price"] = pp.clean_price_series(df["price_sold"])
+    df = df[df["price"] != 0]
+    df["living_area"] = pp.clean_living_area_series(df["living_area"])
+    df = df[df["living_area"] != 0]
+    df["price_m2"] = round(df.price / df.living_area, 1)
+    df["zip"] = df["zip_code"].astype(pp.STRING_DTYPE).str[:4].astype(object)
+    layout = pp.parse_layout_frame(df["num_of_rooms"])
+    df["room"] = layout["room"]
+    df["bedroom"] = layout["bedroom"]
+    df["bathroom"] = pp.find_n_bathroom_series(df["num_of_bathrooms"])
+    for col in config.category_cols:
+        if col in df.columns:
+            df[col] = pp.normalise_series(df[col], pp.CATEGORY_CLEANERS.get(col))
+    df["year_built"] = pp.normalise_series(df["year"], pp.clean_year_series, categorical=False).astype("int64")
+    df["house_age"] = now.year - df["year_built"]
+    df = df[df["date_sold"] != "na"]
+    df["date_sold"] = pp.clean_date_series(df["date_sold"], now)
+    df = df.dropna()
+    df["ym_sold"] = df["date_sold"].dt.to_period("M").dt.to_timestamp()
+    df["year_sold"] = df["date_sold"].dt.year.astype("int64")
+    clean = df[keep_cols].reset_index(drop=True)
+    if config.dtypes.enabled:
+        clean = apply_dtype_policy(clean)
+    return clean
+
+
+def run(variant: str, df: pd.DataFrame, now: datetime) -> pd.DataFrame:
+    if variant == "step by step":
+        return preprocess_step_by_step(df, now)
+    return pp.preprocess_data(df, is_past=True, now=now)
+
+
+def measure(variant: str, n: int, queue: multiprocessing.Queue) -> None:
+    """
+    Run one variant in a fresh process, reporting its time and peak memory.
+
+    Memory is counted as allocations rather than resident memory, which the
+    allocators keep long after it is freed: the peak of the Python and NumPy
+    heap traced by tracemalloc, plus the peak of a fresh pool for Arrow buffers.
+    """
+    config.dtypes.report = False
+    df = synthetic_raw_df(n)
+    now = datetime(2024, 5, 1)
+
+    start = time.perf_counter()
+    run(variant, df, now)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+
+    pool = pa.proxy_memory_pool(pa.default_memory_pool())
+    pa.set_memory_pool(pool)
+    tracemalloc.start()
+    run(variant, df, now)
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queue.put((elapsed, heap_peak / 1e6, pool.max_memory() / 1e6))
+
+
+def main(sizes) -> None:
+    ctx = multiprocessing.get_context("spawn")
+    print(
+        f"{'rows':>9} {'variant':>14} {'time (s)':>9} "
+        f"{'heap peak (MB)':>15} {'arrow peak (MB)':>16}"
+    )
+    for n in sizes:
+        for variant in ("step by step", "narrowed rows"):
+            queue = ctx.Queue()
+            process = ctx.Process(target=measure, args=(variant, n, queue))
+            process.start()
+            elapsed, heap_peak, arrow_peak = queue.get()
+            process.join()
+            print(
+                f"{n:>9} {variant:>14} {elapsed:>9.2f} "
+                f"{heap_peak:>15.0f} {arrow_peak:>16.0f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        help="Specify the numbers of rows to benchmark",
+        default=[100_000, 1_000_000],
+    )
+    args = parser.parse_args()
+    main(args.sizes)
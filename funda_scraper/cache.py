@@ -0,0 +1,104 @@
+"""Persistent cache of downloaded pages"""
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, NamedTuple, Optional
+
+from funda_scraper.config.core import config
+
+
+class CachedResponse(NamedTuple):
+    url: str
+    kind: str
+    body: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class ResponseCache(object):
+    """
+    Store response bodies in a SQLite file, keyed by URL.
+
+    Each entry belongs to a kind of page (e.g. 'search' or 'detail') with its own
+    time to live. Stale entries are not discarded: their ETag and Last-Modified
+    values are used to revalidate them with a conditional request.
+    """
+
+    def __init__(self, path: str, ttl: Optional[Dict[str, float]] = None):
+        """
+        :param path: the SQLite file, created if needed
+        :param ttl: seconds an entry stays fresh per kind, defaults to the config
+        """
+        self.path = path
+        self.ttl = dict(config.cache.ttl if ttl is None else ttl)
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Opened here but used from the scraper's single I/O thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, kind TEXT, body BLOB, "
+            "etag TEXT, last_modified TEXT, fetched_at REAL)"
+        )
+        self._conn.commit()
+
+    def __repr__(self):
+        return f"ResponseCache(path={self.path}, ttl={self.ttl})"
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response for a URL, fresh or not."""
+        row = self._conn.execute(
+            "SELECT url, kind, body, etag, last_modified, fetched_at "
+            "FROM responses WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        url, kind, body, etag, last_modified, fetched_at = row
+        body = zlib.decompress(body).decode("utf-8")
+        return CachedResponse(url, kind, body, etag, last_modified, fetched_at)
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        """Whether an entry can be used without asking the server."""
+        return time.time() - entry.fetched_at < self.ttl.get(entry.kind, 0)
+
+    def put(
+        self,
+        url: str,
+        kind: str,
+        body: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Store or replace the response for a URL."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                url,
+                kind,
+                zlib.compress(body.encode("utf-8")),
+                etag,
+                last_modified,
+                time.time(),
+            ),
+        )
+        self._conn.commit()
+
+    def touch(self, url: str) -> None:
+        """Mark an entry as fresh again, after the server confirmed it is unchanged."""
+        self._conn.execute(
+            "UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url)
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
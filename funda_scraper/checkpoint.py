@@ -0,0 +1,83 @@
+"""Progress of a crawl, kept on disk so that it can be resumed"""
+import json
+import os
+import sqlite3
+from typing import Any, List, Optional
+
+
+class Checkpoint(object):
+    """
+    Record the finished work of a crawl in a SQLite file.
+
+    Search pages are stored with the links found on them and listing pages with
+    their scraped row, both keyed by URL and written as soon as they are done.
+    A crawl that dies halfway can then be run again, skipping everything that
+    is already in the file.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: the SQLite file, created if needed
+        """
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Opened here but used from the scraper's single I/O thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, links TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS listings (url TEXT PRIMARY KEY, row TEXT)")
+        self._conn.commit()
+
+    def __repr__(self):
+        return f"Checkpoint(path={self.path})"
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def get_links(self, page_url: str) -> Optional[List[str]]:
+        """Return the links found on a search page, or None if it was not done."""
+        row = self._conn.execute(
+            "SELECT links FROM pages WHERE url = ?", (page_url,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put_links(self, page_url: str, links: List[str]) -> None:
+        """Record a search page as done, with the links found on it."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?)", (page_url, json.dumps(links))
+        )
+        self._conn.commit()
+
+    def get_row(self, url: str) -> Optional[List[Any]]:
+        """Return the scraped row of a listing page, or None if it was not done."""
+        row = self._conn.execute(
+            "SELECT row FROM listings WHERE url = ?", (url,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put_row(self, url: str, row: List[Any]) -> None:
+        """Record a listing page as done, with its scraped row."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO listings VALUES (?, ?)", (url, json.dumps(row))
+        )
+        self._conn.commit()
+
+    def clear(self, pages: bool = True, listings: bool = True) -> None:
+        """
+        Forget the recorded work, to start a crawl from scratch.
+
+        :param pages: whether to forget the search pages
+        :param listings: whether to forget the listing pages
+        """
+        if pages:
+            self._conn.execute("DELETE FROM pages")
+        if listings:
+            self._conn.execute("DELETE FROM listings")
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
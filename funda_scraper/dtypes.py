@@ -0,0 +1,126 @@
+"""Memory-lean dtypes for scraped dataframes"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from funda_scraper.config.core import config
+from funda_scraper.utils import logger
+
+try:
+    import pyarrow  # noqa: F401
+
+    # Arrow-backed strings take less memory and run most of the str accessor
+    # in compiled kernels
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "string"
+
+# Rows converted to Arrow strings at a time, see to_string_series
+STRING_CHUNK_SIZE = 65_536
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compare the memory used by every column of a dataframe before and after
+    a change of dtypes.
+
+    :return: one row per column with its dtypes, bytes and bytes saved
+    """
+    report = pd.DataFrame(
+        {
+            "dtype_before": before.dtypes.astype(str),
+            "dtype_after": after.dtypes.astype(str),
+            "bytes_before": before.memory_usage(index=False, deep=True),
+            "bytes_after": after.memory_usage(index=False, deep=True),
+        }
+    )
+    report["saved"] = report["bytes_before"] - report["bytes_after"]
+    return report
+
+
+def to_string_series(s: pd.Series) -> pd.Series:
+    """
+    Convert a text series to STRING_DTYPE.
+
+    Long series are converted in chunks of STRING_CHUNK_SIZE rows. Arrow builds
+    a single array by growing its buffer, which for a column of long
+    descriptions peaks at several times the size of the text.
+
+    :param s: a series of strings, with or without missing values
+    :return: the same values as Arrow-backed strings
+    """
+    if STRING_DTYPE != "string[pyarrow]" or len(s) <= STRING_CHUNK_SIZE:
+        return s.astype(STRING_DTYPE)
+
+    import pyarrow as pa
+
+    values = s.to_numpy(dtype=object)
+    chunks = [
+        pa.array(values[i : i + STRING_CHUNK_SIZE], type=pa.large_string(), from_pandas=True)
+        for i in range(0, len(values), STRING_CHUNK_SIZE)
+    ]
+    array = pd.arrays.ArrowStringArray(pa.chunked_array(chunks, type=pa.large_string()))
+    return pd.Series(array, index=s.index, name=s.name)
+
+
+def _fixed_integer(s: pd.Series, dtype: str) -> pd.Series:
+    """Cast integers to the dtype of their column, or int64 if they do not fit."""
+    info = np.iinfo(dtype)
+    if len(s) and (s.min() < info.min or s.max() > info.max):
+        logger.warning(f"*** '{s.name}' does not fit in {dtype}, kept as int64 ***")
+        dtype = "int64"
+    if not isinstance(s.dtype, np.dtype):
+        # Nullable integers stay nullable, e.g. Int8
+        dtype = dtype.capitalize()
+    return s.astype(dtype)
+
+
+def apply_dtype_policy(df: pd.DataFrame, report: Optional[bool] = None) -> pd.DataFrame:
+    """
+    Convert the columns of a dataframe to the leanest dtypes that keep their values.
+
+    Text columns become categories when their values repeat enough (see
+    `dtypes.max_category_ratio` in the config) and Arrow-backed strings
+    otherwise. Columns mixing text and numbers, and columns that already hold
+    Arrow-backed strings, are left as they are. Integers get the fixed dtype of
+    their column in `dtypes.integers`, int64 for the others, so that every run
+    stores the same schema. Datetimes are stored in `dtypes.datetime_unit`.
+
+    :param df: a raw or clean dataframe
+    :param report: whether to log the memory saved, defaults to the config
+    :return: the converted dataframe
+    """
+    policy = config.dtypes
+    report = policy.report if report is None else report
+
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(s):
+            continue
+        if pd.api.types.is_integer_dtype(s):
+            columns[col] = _fixed_integer(s, policy.integers.get(col, "int64"))
+        elif pd.api.types.is_datetime64_dtype(s):
+            columns[col] = s.astype(f"datetime64[{policy.datetime_unit}]")
+        elif pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            # Arrow strings were already kept out of the categories, counting
+            # their distinct values again would copy all of their text
+            if s.dtype == STRING_DTYPE:
+                continue
+            if pd.api.types.infer_dtype(s, skipna=True) != "string":
+                continue
+            if s.nunique() <= policy.max_category_ratio * len(s):
+                columns[col] = s.astype("category")
+            else:
+                columns[col] = to_string_series(s)
+
+    lean = df.assign(**columns)
+    if report:
+        saved = memory_report(df, lean)
+        before, after = saved["bytes_before"].sum(), saved["bytes_after"].sum()
+        logger.info(
+            f"*** Dtypes: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+            f"({saved['saved'].sum() / max(before, 1):.0%} saved) ***"
+        )
+    return lean
@@ -0,0 +1,484 @@
+"""Extract the features of a listing from its HTML"""
+import json
+import re
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from funda_scraper.config.core import config
+from funda_scraper.preprocess import clean_date_format
+from funda_scraper.utils import logger
+
+# Where the listing date may be found when its usual selector comes up empty
+LISTED_SINCE_FALLBACKS = [
+    f".fd-align-items-center:nth-child({i}) span" for i in range(6, 16)
+]
+
+LD_JSON_PATTERN = re.compile(
+    r"<script[^>]*type=[\"']application/ld\+json[\"'][^>]*>(.*?)</script>",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def find_ld_json(html: str) -> List[str]:
+    """The content of every JSON-LD script of a page, without parsing the page."""
+    return LD_JSON_PATTERN.findall(html)
+
+
+def _ld_json_items(html: str) -> Iterator[Dict[str, Any]]:
+    """Every JSON-LD object of a page, including those inside lists and graphs."""
+    for block in find_ld_json(html):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            data = data.get("@graph", [data])
+        if isinstance(data, list):
+            yield from (item for item in data if isinstance(item, dict))
+
+
+def _to_int(value: Any) -> Optional[int]:
+    if isinstance(value, dict):
+        value = value.get("value")
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_iso_date(value: Any) -> Optional[str]:
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_structured_data(html: str) -> Dict[str, str]:
+    """
+    Read raw columns from the schema.org JSON-LD of a listing page.
+
+    Values are strings like the ones read from the HTML, so that a raw column
+    keeps one type whichever pages had JSON-LD. Prices, areas and years are
+    plain digits and dates ISO strings, so preprocess_data does not need to
+    parse them out of text.
+
+    :param html: the page of the house item
+    :return: the columns that were found
+    """
+    values: Dict[str, str] = {}
+
+    def put(key: str, value: Any) -> None:
+        if value not in (None, "") and key not in values:
+            values[key] = str(value)
+
+    for item in _ld_json_items(html):
+        offers = item.get("offers")
+        if isinstance(offers, list):
+            offers = offers[0] if offers else None
+        if isinstance(offers, dict):
+            put("price", _to_int(offers.get("price")))
+            put("listed_since", _to_iso_date(offers.get("validFrom")))
+
+        address = item.get("address")
+        if isinstance(address, dict):
+            put("address", address.get("streetAddress"))
+            zip_code = " ".join(
+                str(address[k]) for k in ("postalCode", "addressLocality") if address.get(k)
+            )
+            put("zip_code", zip_code)
+
+        put("descrip", item.get("description"))
+        put("living_area", _to_int(item.get("floorSize")))
+        put("year", _to_int(item.get("yearBuilt")))
+        put("listed_since", _to_iso_date(item.get("datePosted")))
+    if "listed_since" in values:
+        values["date_list"] = values["listed_since"]
+    return values
+
+
+def get_value_from_css(soup: BeautifulSoup, selector: str) -> str:
+    """Use CSS selector to find certain features."""
+    result = soup.select(selector)
+    if len(result) > 0:
+        result = result[0].text
+    else:
+        result = "na"
+    return result
+
+
+# Text that BeautifulSoup leaves out of .text
+_HIDDEN_TAGS = {"script", "style", "template"}
+
+
+def _soup_string(text: str) -> str:
+    """Collapse a whitespace-only string the way BeautifulSoup does."""
+    if text.strip():
+        return text
+    return "\n" if "\n" in text else " "
+
+
+class Extractor(object):
+    """Base class of the backends that find values in a page with CSS selectors."""
+
+    name = ""
+
+    def parse(self, html: str, containers: Optional[List[str]] = None) -> Any:
+        """
+        Build the tree of a page.
+
+        :param html: the page
+        :param containers: if given, only keep the elements carrying one of these
+            classes, and their content. Backends that build their tree in C
+            parse the whole page anyway.
+        """
+        raise NotImplementedError
+
+    def first_text(self, tree: Any, selector: str) -> str:
+        """The text of the first element matching the selector, or 'na'."""
+        raise NotImplementedError
+
+    def all_attrs(self, tree: Any, selector: str, attr: str) -> List[str]:
+        """The attribute of every element matching the selector."""
+        raise NotImplementedError
+
+    def elements(self, tree: Any) -> Iterator[Any]:
+        """Every element of a tree or subtree, in document order."""
+        raise NotImplementedError
+
+    def children(self, element: Any) -> Iterator[Any]:
+        """The child elements of an element."""
+        raise NotImplementedError
+
+    def tag(self, element: Any) -> str:
+        raise NotImplementedError
+
+    def classes(self, element: Any) -> List[str]:
+        raise NotImplementedError
+
+    def text(self, element: Any) -> str:
+        """The text of an element, as BeautifulSoup's .text would give it."""
+        raise NotImplementedError
+
+
+class SoupExtractor(Extractor):
+    """BeautifulSoup backend, the slowest but the most forgiving one."""
+
+    name = "bs4"
+
+    def parse(self, html: str, containers: Optional[List[str]] = None) -> BeautifulSoup:
+        if containers is None:
+            return BeautifulSoup(html, "lxml")
+        return BeautifulSoup(html, "lxml", parse_only=SoupStrainer(class_=containers))
+
+    def first_text(self, tree: BeautifulSoup, selector: str) -> str:
+        return get_value_from_css(tree, selector)
+
+    def all_attrs(self, tree: BeautifulSoup, selector: str, attr: str) -> List[str]:
+        return [p.get(attr) for p in tree.select(selector)]
+
+    def elements(self, tree: BeautifulSoup) -> Iterator[Any]:
+        return iter(tree.find_all(True))
+
+    def children(self, element: Any) -> Iterator[Any]:
+        return iter(element.find_all(True, recursive=False))
+
+    def tag(self, element: Any) -> str:
+        return element.name
+
+    def classes(self, element: Any) -> List[str]:
+        return element.get("class", [])
+
+    def text(self, element: Any) -> str:
+        return element.text
+
+
+class LxmlExtractor(Extractor):
+    """lxml backend, with every selector compiled to XPath only once."""
+
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from lxml import etree
+        from lxml.cssselect import CSSSelector
+
+        self._fromstring = lxml.html.document_fromstring
+        self._selector_class = CSSSelector
+        self._element_class = etree.Element
+        self._texts = etree.XPath(
+            "descendant-or-self::text()"
+            f"[not(parent::{' or parent::'.join(sorted(_HIDDEN_TAGS))})]"
+        )
+        self._compiled: Dict[str, Any] = {}
+        for selector in known_selectors():
+            self._compile(selector)
+
+    def _compile(self, selector: str) -> Any:
+        compiled = self._compiled.get(selector)
+        if compiled is None:
+            compiled = self._selector_class(selector)
+            self._compiled[selector] = compiled
+        return compiled
+
+    def parse(self, html: str, containers: Optional[List[str]] = None) -> Any:
+        return self._fromstring(html or "<html></html>")
+
+    def first_text(self, tree: Any, selector: str) -> str:
+        result = self._compile(selector)(tree)
+        return self.text(result[0]) if result else "na"
+
+    def all_attrs(self, tree: Any, selector: str, attr: str) -> List[str]:
+        return [e.get(attr) for e in self._compile(selector)(tree)]
+
+    def elements(self, tree: Any) -> Iterator[Any]:
+        return tree.iter(self._element_class)
+
+    def children(self, element: Any) -> Iterator[Any]:
+        return element.iterchildren(self._element_class)
+
+    def tag(self, element: Any) -> str:
+        return element.tag
+
+    def classes(self, element: Any) -> List[str]:
+        return element.get("class", "").split()
+
+    def text(self, element: Any) -> str:
+        return "".join(_soup_string(t) for t in self._texts(element))
+
+
+class SelectolaxExtractor(Extractor):
+    """selectolax (lexbor) backend, needs the optional selectolax package."""
+
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+
+        self._parser_class = LexborHTMLParser
+
+    def parse(self, html: str, containers: Optional[List[str]] = None) -> Any:
+        return self._parser_class(html)
+
+    def first_text(self, tree: Any, selector: str) -> str:
+        node = tree.css_first(selector)
+        return "na" if node is None else self.text(node)
+
+    def all_attrs(self, tree: Any, selector: str, attr: str) -> List[str]:
+        return [n.attributes.get(attr) for n in tree.css(selector)]
+
+    def elements(self, tree: Any) -> Iterator[Any]:
+        # Either a whole parsed page or one of its nodes
+        node = getattr(tree, "root", tree)
+        return iter([]) if node is None else node.traverse()
+
+    def children(self, element: Any) -> Iterator[Any]:
+        return element.iter()
+
+    def tag(self, element: Any) -> str:
+        return element.tag
+
+    def classes(self, element: Any) -> List[str]:
+        return (element.attributes.get("class") or "").split()
+
+    def text(self, element: Any) -> str:
+        return "".join(
+            _soup_string(n.text_content)
+            for n in element.traverse(include_text=True)
+            if n.tag == "-text" and n.parent.tag not in _HIDDEN_TAGS
+        )
+
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+    SelectolaxExtractor.name: SelectolaxExtractor,
+}
+_extractors: Dict[str, Extractor] = {}
+
+
+def known_selectors() -> List[str]:
+    """Every selector a listing page may be queried with."""
+    selectors = [s for s in config.css_selector.values() if s != "none"]
+    selectors += [
+        ".fd-align-items-center:nth-child(7) span",
+        ".fd-align-items-center:nth-child(9) span",
+    ]
+    return selectors + LISTED_SINCE_FALLBACKS
+
+
+def get_extractor(backend: str) -> Extractor:
+    """
+    Return the extractor of a backend, built once per process.
+
+    Falls back to BeautifulSoup when the library of the backend is not installed.
+    """
+    if backend not in EXTRACTORS:
+        raise ValueError(f"'backend' must be one of {', '.join(EXTRACTORS)}.")
+
+    if backend not in _extractors:
+        try:
+            _extractors[backend] = EXTRACTORS[backend]()
+        except ImportError as e:
+            logger.warning(f"Backend '{backend}' is not available ({e}), using bs4 instead.")
+            _extractors[backend] = get_extractor(SoupExtractor.name)
+    return _extractors[backend]
+
+
+def _normalise_label(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def index_page(extractor: Extractor, tree: Any) -> Dict[str, str]:
+    """
+    Find the raw columns configured in config.page_index with one walk of the page.
+
+    The values next to each label of the kenmerken lists, the whole lists under
+    each title and the first element of each class are all collected in the same
+    pass, instead of querying the whole page once per column.
+
+    :param extractor: the backend the tree was parsed with
+    :param tree: the parsed page
+    :return: the text of every raw column that was found, keyed by column
+    """
+    page_index = config.page_index
+    by_class = {c: key for key, c in page_index.classes.items()}
+    nested = {outer: (key, inner) for key, (outer, inner) in page_index.nested_classes.items()}
+    by_label = {
+        _normalise_label(label): key
+        for key, labels in page_index.labels.items()
+        for label in labels
+    }
+    by_section = {
+        _normalise_label(title): key
+        for key, titles in page_index.sections.items()
+        for title in titles
+    }
+
+    values: Dict[str, str] = {}
+    section = None
+    for element in extractor.elements(tree):
+        tag = extractor.tag(element)
+        classes = extractor.classes(element)
+
+        for c in classes:
+            if c in by_class and by_class[c] not in values:
+                values[by_class[c]] = extractor.text(element)
+            if c in nested and nested[c][0] not in values:
+                key, inner = nested[c]
+                for child in extractor.elements(element):
+                    if inner in extractor.classes(child):
+                        values[key] = extractor.text(child)
+                        break
+
+        if tag == "h3":
+            section = by_section.get(_normalise_label(extractor.text(element)))
+        elif tag == "dl" and "object-kenmerken-list" in classes:
+            if section is not None and section not in values:
+                values[section] = extractor.text(element)
+            section = None
+
+            key = None
+            for child in extractor.children(element):
+                child_tag = extractor.tag(child)
+                if child_tag == "dt":
+                    key = by_label.get(_normalise_label(extractor.text(child)))
+                elif child_tag == "dd" and key is not None:
+                    values.setdefault(key, extractor.text(child))
+                    key = None
+
+    # A column whose CSS selector is just its class is known to be absent
+    for c, key in by_class.items():
+        if key not in values and config.css_selector.get(key) == f".{c}":
+            values[key] = "na"
+    return values
+
+
+def parse_listing(
+    html: str,
+    link: str,
+    list_since_selector: str,
+    backend: str = "bs4",
+    single_pass: bool = False,
+    partial: bool = False,
+    structured: bool = False,
+) -> List[Any]:
+    """
+    Extract all the features of one house item from the HTML of its page.
+
+    This is a plain function of its arguments so that it can run in a worker process.
+
+    :param html: the page of the house item
+    :param link: the url of the page, which is the first value of the row
+    :param list_since_selector: the CSS selector of the listing date
+    :param backend: the name of the extractor, see EXTRACTORS
+    :param single_pass: whether to find the columns with index_page, using the CSS
+        selectors only for the columns it could not find
+    :param partial: whether to only build the parts of the page listed in
+        config.partial_parse
+    :param structured: whether to take the columns found by parse_structured_data
+        first, before looking at the HTML
+    :return: one row with a value for each key of config.css_selector
+    """
+    selectors = config.css_selector
+    extractor = get_extractor(backend)
+    tree = extractor.parse(html, list(config.partial_parse) if partial else None)
+    index = index_page(extractor, tree) if single_pass else {}
+    if structured:
+        index = {**index, **parse_structured_data(html)}
+
+    def value(key: str, selector: Optional[str] = None) -> Any:
+        if key in index:
+            return index[key]
+        return extractor.first_text(tree, selectors[key] if selector is None else selector)
+
+    result = [
+        link,
+        value("price"),
+        value("address"),
+        value("descrip"),
+        value("listed_since", list_since_selector),
+        value("zip_code"),
+        value("size"),
+        value("year"),
+        value("living_area"),
+        value("kind_of_house"),
+        value("building_type"),
+        value("num_of_rooms"),
+        value("num_of_bathrooms"),
+        value("layout"),
+        value("energy_label"),
+        value("insulation"),
+        value("heating"),
+        value("ownership"),
+        value("exteriors"),
+        value("parking"),
+        value("neighborhood_name"),
+        value("date_list"),
+        value("date_sold"),
+        value("term"),
+        value("price_sold"),
+        value("last_ask_price"),
+        value("last_ask_price_m2").split("\r")[0],
+    ]
+
+    # Deal with list_since_selector especially, since its CSS varies sometimes
+    if clean_date_format(result[4]) == "na":
+        for selector in LISTED_SINCE_FALLBACKS:
+            update_list_since = extractor.first_text(tree, selector)
+            if clean_date_format(update_list_since) == "na":
+                pass
+            else:
+                result[4] = update_list_since
+
+    photos_list = extractor.all_attrs(tree, selectors.photo, "data-lazy-srcset")
+    photos_string = ", ".join(photos_list)
+
+    # Clean up the retried result from one page
+    result = [
+        r.replace("\n", "").replace("\r", "").strip() if isinstance(r, str) else r
+        for r in result
+    ]
+    result.append(photos_string)
+    return result
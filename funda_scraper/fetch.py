@@ -0,0 +1,329 @@
+"""HTTP fetching helpers shared by all scraping phases"""
+import asyncio
+import codecs
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+import aiohttp
+
+from funda_scraper.config.core import config
+
+
+class FetchResult(NamedTuple):
+    status: Optional[int]
+    text: str = ""
+    retry_after: Optional[float] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def build_session(
+    headers: Optional[Dict[str, str]] = None, **options
+) -> aiohttp.ClientSession:
+    """
+    Create one pooled client session to be reused by every request of a run.
+
+    Connector settings come from the `session` section of the config and can be
+    overridden with keyword arguments, e.g. `build_session(limit_per_host=4)`.
+
+    :param headers: default headers sent with every request
+    :param options: overrides for the `session` config values
+    :return: an open aiohttp client session
+    """
+    settings = {**config.session, **options}
+    connector = aiohttp.TCPConnector(
+        limit=settings["limit"],
+        limit_per_host=settings["limit_per_host"],
+        ttl_dns_cache=settings["ttl_dns_cache"],
+        keepalive_timeout=settings["keepalive_timeout"],
+    )
+    timeout = aiohttp.ClientTimeout(total=settings["timeout"])
+    return aiohttp.ClientSession(
+        headers=config.header if headers is None else headers,
+        connector=connector,
+        timeout=timeout,
+    )
+
+
+async def read_until(
+    response: aiohttp.ClientResponse,
+    pattern: Pattern[str],
+    chunk_size: int = 16384,
+    markers: Optional[Tuple[str, str]] = ("<script", "</script>"),
+) -> str:
+    """
+    Read a response body only as far as the first match of a pattern.
+
+    The connection is closed as soon as the pattern is found, so the rest of the
+    body is never transferred.
+
+    :param response: the response to read
+    :param pattern: the pattern to look for
+    :param chunk_size: the number of bytes read at a time
+    :param markers: text, compared case-insensitively, that every match starts
+        with and the first text after that it ends with. Only the text from the
+        earliest unfinished start is searched, once a chunk brings in an end.
+        If None, the whole body is searched again after every chunk.
+    :return: the body read so far
+    """
+    decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    chunks: List[str] = []
+
+    if markers is None:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            chunks.append(decoder.decode(chunk))
+            text = "".join(chunks)
+            if pattern.search(text):
+                response.close()
+                return text
+            chunks = [text]
+        chunks.append(decoder.decode(b"", final=True))
+        return "".join(chunks)
+
+    start, end = (re.compile(re.escape(m), re.IGNORECASE) for m in markers)
+    # Enough of the previous text to find a marker split across two chunks
+    overlap = max(len(m) for m in markers) - 1
+    pending: Optional[str] = None
+    tail = ""
+    async for chunk in response.content.iter_chunked(chunk_size):
+        piece = decoder.decode(chunk)
+        chunks.append(piece)
+        if pending is None:
+            window = tail + piece
+            found = start.search(window)
+            if found is None:
+                tail = window[max(len(window) - overlap, 0):]
+                continue
+            pending = window[found.start():]
+            new_from = 0
+        else:
+            new_from = max(len(pending) - overlap, 0)
+            pending += piece
+        if end.search(pending, new_from) is None:
+            continue
+        if pattern.search(pending):
+            response.close()
+            return "".join(chunks)
+        # Every start before the last end is finished, a match can only come later
+        *_, last = end.finditer(pending)
+        found = start.search(pending, last.end())
+        if found is None:
+            tail = pending[max(last.end(), len(pending) - overlap):]
+            pending = None
+        else:
+            pending = pending[found.start():]
+    chunks.append(decoder.decode(b"", final=True))
+    return "".join(chunks)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Read a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryPolicy(object):
+    """
+    Decide whether and when a failed request is sent again.
+
+    Delays grow exponentially from `base_delay` up to `max_delay` with full
+    jitter, but never undercut a Retry-After header. A URL is given up once
+    `max_attempts` requests were sent or the next wait would exceed `budget`
+    seconds since its first attempt.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        budget: float = 120.0,
+        statuses: Sequence[int] = (429, 500, 502, 503, 504),
+    ):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.statuses = set(statuses)
+
+    def __repr__(self):
+        return (f"RetryPolicy(max_attempts={self.max_attempts}, "
+            f"base_delay={self.base_delay}, "
+            f"max_delay={self.max_delay}, "
+            f"budget={self.budget})")
+
+    def is_retryable(self, status: Optional[int]) -> bool:
+        """Whether a response status (None if no response) is worth retrying."""
+        return status is None or status in self.statuses
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait after the given (1-based) failed attempt."""
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class TokenBucket(object):
+    """
+    Cap the request rate of a whole run, however many coroutines share it.
+
+    Tokens refill continuously at `rate` per second up to `burst`; every request
+    takes one token and waits in arrival order when none is left.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.0):
+        if rate <= 0:
+            raise ValueError("'rate' must be a positive number of requests per second.")
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.jitter = max(jitter, 0.0)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __repr__(self):
+        return (f"TokenBucket(rate={self.rate}, "
+            f"burst={self.burst}, "
+            f"jitter={self.jitter})")
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        # Created lazily so that the lock binds to the running event loop
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+        if self.jitter:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limit the requests in flight with additive-increase / multiplicative-decrease.
+
+    Every response is reported through `record`. Throttling statuses, connection
+    failures or a p95 latency above `latency_target` shrink the limit by the
+    `decrease` factor (at most once per `cooldown` seconds); every other response
+    grows it by `increase / limit`, i.e. about `increase` slots per round trip.
+    Use the instance as an async context manager around each request.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_target: Optional[float] = None,
+        window: int = 50,
+        cooldown: float = 1.0,
+        backoff_statuses: Sequence[int] = (429, 503),
+    ):
+        if not 0 < decrease < 1:
+            raise ValueError("'decrease' must be between 0 and 1.")
+        self.max_limit = max(max_limit, 1)
+        self.min_limit = min(max(min_limit, 1), self.max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.backoff_statuses = set(backoff_statuses)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._latencies: Deque[float] = deque(maxlen=max(window, 1))
+        self._last_decrease = float("-inf")
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __repr__(self):
+        return (f"AdaptiveConcurrency(limit={int(self.limit)}, "
+            f"min_limit={self.min_limit}, "
+            f"max_limit={self.max_limit}, "
+            f"in_flight={self.in_flight})")
+
+    @property
+    def p95(self) -> Optional[float]:
+        """95th percentile latency over the recent window, in seconds."""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _condition(self) -> asyncio.Condition:
+        # Created lazily so that the condition binds to the running event loop
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    async def __aenter__(self) -> "AdaptiveConcurrency":
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def record(self, status: Optional[int], latency: float) -> None:
+        """
+        Feed back the outcome of one request.
+
+        :param status: HTTP status code, or None if no response was received
+        :param latency: seconds between sending the request and the response
+        """
+        self._latencies.append(latency)
+        congested = status is None or status in self.backoff_statuses
+        if (
+            not congested
+            and self.latency_target is not None
+            and len(self._latencies) >= 10
+        ):
+            congested = self.p95 > self.latency_target
+
+        if congested:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                # Judge the new limit on fresh latencies only
+                self._latencies.clear()
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
@@ -1,18 +1,26 @@
 """Preprocess raw data scraped from Funda"""
 import re
 from datetime import datetime, timedelta
-from typing import List, Union
+from functools import lru_cache, partial
+from typing import Callable, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
-from dateutil.parser import parse
+from pandas.api.types import union_categoricals
 
 from funda_scraper.config.core import config
+from funda_scraper.dtypes import STRING_DTYPE, apply_dtype_policy
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import asyncio
 
-def clean_price(x: str) -> int:
+def clean_price(x: Union[str, int]) -> int:
     """Clean the 'price' and transform from string to integer."""
+    if isinstance(x, (int, float)):
+        return int(x)
+    if re.fullmatch("[0-9]+", str(x)):
+        # Plain digits, from structured data
+        return int(x)
     try:
         return int(str(x).split(" ")[1].replace(".", ""))
     except ValueError:
@@ -21,8 +29,10 @@ def clean_price(x: str) -> int:
         return 0
 
 
-def clean_year(x: str) -> int:
+def clean_year(x: Union[str, int]) -> int:
     """Clean the 'year' and transform from string to integer"""
+    if isinstance(x, (int, float)):
+        return int(x)
     if len(x) == 4:
         return int(x)
     elif x.find("-") != -1:
@@ -33,8 +43,10 @@ def clean_year(x: str) -> int:
         return 0
 
 
-def clean_living_area(x: str) -> int:
+def clean_living_area(x: Union[str, int]) -> int:
     """Clean the 'living_area' and transform from string to integer"""
+    if isinstance(x, (int, float)):
+        return int(x)
     try:
         return int(str(x).replace(",", "").split(" m²")[0])
     except ValueError:
@@ -53,37 +65,76 @@ def find_keyword_from_regex(x: str, pattern: str) -> int:
     return int(x)
 
 
+# The number before the first mention of rooms, bedrooms or bathrooms, in any order
+LAYOUT_PATTERN = re.compile(
+    r"(\d{1,2})\s(?:(kamers?|rooms?)|(slaapkamers?|bedrooms?)|(badkamers?|bathrooms?))"
+)
+LAYOUT_COLS = ["room", "bedroom", "bathroom"]
+
+
+@lru_cache(maxsize=4096)
+def parse_layout(x: str) -> Tuple[int, int, int]:
+    """
+    Find the number of rooms, bedrooms and bathrooms in one scan of a string.
+
+    Layout strings repeat a lot across listings, so results are memoised.
+    """
+    found: List[Optional[int]] = [None, None, None]
+    for match in LAYOUT_PATTERN.finditer(x):
+        # Group 2, 3 or 4 tells which of the three was matched
+        kind = match.lastindex - 2
+        if found[kind] is None:
+            found[kind] = int(match.group(1))
+            if None not in found:
+                break
+    return tuple(0 if n is None else n for n in found)
+
+
 def find_n_room(x: str) -> int:
     """Find the number of rooms from a string"""
-    pattern = r"(\d{1,2}\s{1}kamers{0,1})|(\d{1,2}\s{1}rooms{0,1})"
-    return find_keyword_from_regex(x, pattern)
+    return parse_layout(x)[0]
 
 
 def find_n_bedroom(x: str) -> int:
     """Find the number of bedrooms from a string"""
-    pattern = r"(\d{1,2}\s{1}slaapkamers{0,1})|(\d{1,2}\s{1}bedrooms{0,1})"
-    return find_keyword_from_regex(x, pattern)
+    return parse_layout(x)[1]
 
 
 def find_n_bathroom(x: str) -> int:
     """Find the number of bathrooms from a string"""
-    pattern = r"(\d{1,2}\s{1}badkamers{0,1})|(\d{1,2}\s{1}bathrooms{0,1})"
-    return find_keyword_from_regex(x, pattern)
+    return parse_layout(x)[2]
+
+
+# Dutch months that are spelled differently in English
+DUTCH_MONTHS = {
+    "januari": "January",
+    "februari": "February",
+    "maart": "March",
+    "mei": "May",
+    "juni": "June",
+    "juli": "July",
+    "augustus": "August",
+    "oktober": "October",
+}
+
+# Dutch weekdays, numbered like datetime.weekday()
+DUTCH_WEEKDAYS = {
+    "maandag": 0,
+    "dinsdag": 1,
+    "woensdag": 2,
+    "donderdag": 3,
+    "vrijdag": 4,
+    "zaterdag": 5,
+    "zondag": 6,
+}
+
+# Replacements turning Funda's relative dates into the keywords parsed below
+RELATIVE_DATE_WORDS = {"weken": "week", "maanden": "month", "Vandaag": "Today", "+": ""}
 
 
 def map_dutch_month(x: str) -> str:
     """Map the month from Dutch to English."""
-    month_mapping = {
-        "januari": "January",
-        "februari": "February",
-        "maart": "March",
-        "mei": "May",
-        "juni": "June",
-        "juli": "July",
-        "augustus": "August",
-        "oktober": "October",
-    }
-    for k, v in month_mapping.items():
+    for k, v in DUTCH_MONTHS.items():
         if x.find(k) != -1:
             x = x.replace(k, v)
     return x
@@ -106,34 +157,33 @@ def clean_energy_label(x: str) -> str:
         return x
 
 
-def clean_date_format(x: str) -> Union[datetime, str]:
-    """Transform the date from string to datetime object."""
+def clean_date_format(x: str, now: Optional[datetime] = None) -> Union[datetime, str]:
+    """
+    Transform the date from string to datetime object.
 
-    x = x.replace("weken", "week")
-    x = x.replace("maanden", "month")
-    x = x.replace("Vandaag", "Today")
-    x = x.replace("+", "")
+    :param x: an absolute or relative date, e.g. '30 juni 2023' or '3 weken'
+    :param now: the moment relative dates are counted back from, defaults to now
+    """
+
+    # Dates read from structured data are already in ISO format
+    try:
+        return datetime.fromisoformat(x)
+    except ValueError:
+        pass
+
+    for k, v in RELATIVE_DATE_WORDS.items():
+        x = x.replace(k, v)
     x = map_dutch_month(x)
 
+    now = datetime.now() if now is None else now
+
     def delta_now(d: int):
         t = timedelta(days=d)
-        return datetime.now() - t
-
-    weekdays_dict = {
-        "maandag": "Monday",
-        "dinsdag": "Tuesday",
-        "woensdag": "Wednesday",
-        "donderdag": "Thursday",
-        "vrijdag": "Friday",
-        "zaterdag": "Saturday",
-        "zondag": "Sunday",
-    }
+        return now - t
 
     try:
-        if x.lower() in weekdays_dict.keys():
-            date_string = weekdays_dict.get(x.lower())
-            parsed_date = parse(date_string, fuzzy=True)
-            delta = datetime.now().weekday() - parsed_date.weekday()
+        if x.lower() in DUTCH_WEEKDAYS:
+            delta = now.weekday() - DUTCH_WEEKDAYS[x.lower()]
             x = delta_now(delta)
 
         elif x.find("month") != -1:
@@ -152,8 +202,231 @@ def clean_date_format(x: str) -> Union[datetime, str]:
         return "na"
 
 
+# Patterns of the vectorised cleaning below. Each one reads the same part of a
+# raw value as the scalar function of the same field.
+INT_PATTERN = re.compile(r"[+-]?\d{1,18}")
+SECOND_WORD_PATTERN = re.compile(r"^[^ ]* ([^ ]*)")
+HOUSE_PATTERN = re.compile(r"/([^/-]*)-([^/-]*)[^/]*/[^/]*$")
+
+
+def _extract(text: pd.Series, pattern: re.Pattern, group: int = 1) -> pd.Series:
+    """
+    Like text.str.extract, the group of the first match of a pattern, NA if none.
+
+    Done with str.match and str.replace, which unlike str.extract do not fall
+    back to a Python call per value on Arrow-backed strings.
+    """
+    whole = f"(?s)^.*?(?:{pattern.pattern}).*$"
+    found = text.str.match(whole).fillna(False).astype(bool)
+    return text.str.replace(whole, f"\\{group}", regex=True).where(found)
+
+
+def _before(text: pd.Series, sep: str) -> pd.Series:
+    """Like text.str.split(sep).str[0]."""
+    return text.str.replace(f"(?s){re.escape(sep)}.*", "", regex=True)
+
+
+def _split_raw(s: pd.Series) -> Tuple[pd.Series, Optional[pd.Series]]:
+    """
+    Split a raw column into its text and the numbers it may hold, e.g. when
+    the raw dataframe was put together outside of the scraper.
+
+    :return: the text, NA where the value is not a string, and the numbers,
+        NA where it is not a number (None if there are none)
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(object)
+    if pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+        return s.astype(STRING_DTYPE), None
+    is_number = s.map(lambda x: isinstance(x, (int, float)) and not isinstance(x, bool))
+    is_text = s.map(lambda x: isinstance(x, str))
+    return s.where(is_text).astype(STRING_DTYPE), pd.to_numeric(s.where(is_number))
+
+
+def _parse_int(token: pd.Series) -> pd.Series:
+    """Convert strings to integers the way int() does, NA where it would fail."""
+    token = token.str.strip()
+    valid = token.str.fullmatch(INT_PATTERN.pattern).fillna(False).astype(bool)
+    return token.where(valid).astype("Int64")
+
+
+def _to_int(token: pd.Series) -> pd.Series:
+    """Like _parse_int, with 0 where int() would fail."""
+    return _parse_int(token).fillna(0).astype("int64")
+
+
+def _clean_int(s: pd.Series, find: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """Find an integer in every text of a raw column, keeping numbers as they are."""
+    text, numbers = _split_raw(s)
+    result = _to_int(find(text))
+    if numbers is not None:
+        result = result.mask(numbers.notna(), numbers.fillna(0).astype("int64"))
+    return result
+
+
+def clean_price_series(s: pd.Series) -> pd.Series:
+    """Vectorised clean_price."""
+
+    def find(text: pd.Series) -> pd.Series:
+        digits = text.str.fullmatch("[0-9]+").fillna(False).astype(bool)
+        token = _extract(text, SECOND_WORD_PATTERN).str.replace(".", "", regex=False)
+        return token.mask(digits, text)
+
+    return _clean_int(s, find)
+
+
+def clean_living_area_series(s: pd.Series) -> pd.Series:
+    """Vectorised clean_living_area."""
+    return _clean_int(s, lambda text: _before(text.str.replace(",", "", regex=False), " m²"))
+
+
+def clean_year_series(s: pd.Series) -> pd.Series:
+    """Vectorised clean_year."""
+
+    def find(text: pd.Series) -> pd.Series:
+        dash = text.str.contains("-", regex=False).fillna(False).astype(bool)
+        before = text.str.contains("before", regex=False).fillna(False).astype(bool)
+        four = (text.str.len() == 4).fillna(False).astype(bool)
+        token = _before(text, "-").where(dash)
+        token = token.mask(~dash & before, _extract(text, SECOND_WORD_PATTERN))
+        return token.mask(four, text)
+
+    return _clean_int(s, find)
+
+
+def parse_layout_frame(s: pd.Series) -> pd.DataFrame:
+    """
+    Vectorised parse_layout, with a room, bedroom and bathroom column.
+
+    Every distinct string is scanned once and the results are spread back over
+    the rows, missing values give zeros.
+    """
+    codes, uniques = pd.factorize(s)
+    # One extra row of zeros for the missing values, whose code is -1
+    table = np.zeros((len(uniques) + 1, len(LAYOUT_COLS)), dtype="int64")
+    for i, x in enumerate(uniques):
+        table[i] = parse_layout(str(x))
+    return pd.DataFrame(table[codes], index=s.index, columns=LAYOUT_COLS)
+
+
+def find_n_room_series(s: pd.Series) -> pd.Series:
+    """Vectorised find_n_room."""
+    return parse_layout_frame(s)["room"]
+
+
+def find_n_bedroom_series(s: pd.Series) -> pd.Series:
+    """Vectorised find_n_bedroom."""
+    return parse_layout_frame(s)["bedroom"]
+
+
+def find_n_bathroom_series(s: pd.Series) -> pd.Series:
+    """Vectorised find_n_bathroom."""
+    return parse_layout_frame(s)["bathroom"]
+
+
+def clean_energy_label_series(s: pd.Series) -> pd.Series:
+    """Vectorised clean_energy_label."""
+    label = _before(s.astype(STRING_DTYPE), " ")
+    is_a_plus = label.str.contains("A+", regex=False).fillna(False).astype(bool)
+    return label.mask(is_a_plus, ">A+").astype(object)
+
+
+def normalise_series(
+    s: pd.Series,
+    clean: Optional[Callable[[pd.Series], pd.Series]] = None,
+    categorical: bool = True,
+) -> pd.Series:
+    """
+    Clean a column with few distinct values by cleaning each of them only once.
+
+    The column is factorised, the (vectorised) cleaning function runs on the
+    distinct values only and the results are mapped back to the rows through
+    the codes.
+
+    :param s: a raw column
+    :param clean: e.g. clean_year_series, defaults to keeping the values as they are
+    :param categorical: whether to return a category column
+    :return: the cleaned column, with the index of s
+    """
+    codes, uniques = pd.factorize(s)
+    if clean is not None:
+        uniques = clean(pd.Series(uniques, dtype=object))
+    values = pd.Index(uniques)
+    if not categorical:
+        return pd.Series(values.take(codes, allow_fill=True), index=s.index, name=s.name)
+
+    # Different raw values may be cleaned into the same one
+    value_codes, categories = pd.factorize(values)
+    codes = np.where(codes == -1, -1, value_codes[codes])
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories), index=s.index, name=s.name
+    )
+
+
+# Cleaning functions of the low-cardinality columns in config.category_cols
+CATEGORY_CLEANERS = {"energy_label": clean_energy_label_series}
+
+
+ISO_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def clean_date_series(s: pd.Series, now: Optional[datetime] = None) -> pd.Series:
+    """
+    Vectorised clean_date_format, with NaT where it returns 'na'.
+
+    Every relative date is counted back from the same moment, so that one call
+    gives the same dates however long it runs.
+
+    :param s: absolute or relative dates, e.g. '30 juni 2023' or '3 weken'
+    :param now: the moment relative dates are counted back from, defaults to now
+    """
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    text = s.astype(STRING_DTYPE)
+
+    # Dates read from structured data are already in ISO format
+    is_iso = text.str.match(ISO_DATE_PATTERN.pattern).fillna(False).astype(bool)
+    result = pd.to_datetime(text.where(is_iso), format="ISO8601", errors="coerce")
+    result = result.astype("datetime64[ns]")
+
+    for k, v in {**RELATIVE_DATE_WORDS, **DUTCH_MONTHS}.items():
+        text = text.str.replace(k, v, regex=False)
+
+    def contains(word: str) -> pd.Series:
+        return text.str.contains(word, regex=False).fillna(False).astype(bool)
+
+    def days_ago(days: pd.Series) -> pd.Series:
+        return now - pd.to_timedelta(days.astype("float64"), unit="D")
+
+    todo = ~is_iso
+    weekday = text.str.lower().map(DUTCH_WEEKDAYS)
+    is_weekday = todo & weekday.notna()
+    result = result.mask(is_weekday, days_ago(now.weekday() - weekday))
+    todo &= ~is_weekday
+
+    # Like the scalar function, only the first digit of months and weeks is read
+    for word, days in (("month", 30), ("week", 7)):
+        found = todo & contains(word)
+        n = _parse_int(_before(text, word).str.strip().str[0])
+        result = result.mask(found, days_ago(n * days))
+        todo &= ~found
+
+    found = todo & contains("Today")
+    result = result.mask(found, now - pd.Timedelta(days=1))
+    todo &= ~found
+
+    found = todo & contains("day")
+    result = result.mask(found, days_ago(_parse_int(_before(text, "day"))))
+    todo &= ~found
+
+    absolute = pd.to_datetime(text.where(todo), format="%d %B %Y", errors="coerce")
+    return result.mask(todo, absolute)
+
+
 def preprocess_data(
-    df: pd.DataFrame, is_past: bool, keep_extra_cols: List[str] = None
+    df: pd.DataFrame,
+    is_past: bool,
+    keep_extra_cols: List[str] = None,
+    now: Optional[datetime] = None,
 ) -> pd.DataFrame:
     """
     Clean the raw dataframe from scraping.
@@ -162,57 +435,155 @@ def preprocess_data(
     :param df: raw dataframe from scraping
     :param is_past: whether it scraped past data
     :param keep_extra_cols: specify additional column names to keep in the final df
+    :param now: the moment relative dates and ages are counted from, defaults to now
     :return: clean dataframe
     """
+    now = datetime.now() if now is None else now
 
-    df = df.dropna()
     if not is_past:
-        keep_cols = config.keep_cols.selling_data
+        keep_cols = list(config.keep_cols.selling_data)
     else:
         keep_cols = config.keep_cols.selling_data + config.keep_cols.sold_data
 
     if keep_extra_cols is not None:
         keep_cols.extend(keep_extra_cols)
 
-    # Info
-    df["house_id"] = df["url"].apply(lambda x: int(x.split("/")[-2].split("-")[1]))
-    df["house_type"] = df["url"].apply(lambda x: x.split("/")[-2].split("-")[0])
-    df = df[df["house_type"].isin(["appartement", "huis"])]
+    # Rows are filtered by narrowing one boolean mask. Every step only takes the
+    # raw columns it needs for the rows left by the previous steps, so the raw
+    # frame is never copied as a whole and nothing is written into a slice of it.
+    # A mask rather than positions lets Arrow filter chunked columns chunk by chunk.
+    valid = df.notna().all(axis=1).to_numpy(copy=True)
+    cols = {}
+
+    def raw(col: str) -> pd.Series:
+        """A raw column over the rows left."""
+        return df[col][valid].reset_index(drop=True)
+
+    def narrow(keep: pd.Series) -> None:
+        """Drop the rows that are not kept, from the mask and the derived columns."""
+        keep = keep.to_numpy()
+        valid[valid] = keep
+        for col in cols:
+            cols[col] = cols[col][keep].reset_index(drop=True)
+
+    # Info, from urls like .../koop/amsterdam/huis-42000000-straat-1/
+    url = raw("url").astype(STRING_DTYPE)
+    cols["house_id"] = _extract(url, HOUSE_PATTERN, group=2)
+    cols["house_type"] = _extract(url, HOUSE_PATTERN).astype(object)
+    del url
+    narrow(cols["house_type"].isin(["appartement", "huis"]))
 
     # Price
     price_col = "price_sold" if is_past else "price"
-    df["price"] = df[price_col].apply(clean_price)
-    df = df[df["price"] != 0]
-    df["living_area"] = df["living_area"].apply(clean_living_area)
-    df = df[df["living_area"] != 0]
-    df["price_m2"] = round(df.price / df.living_area, 1)
+    cols["price"] = clean_price_series(raw(price_col))
+    narrow(cols["price"] != 0)
+    cols["living_area"] = clean_living_area_series(raw("living_area"))
+    narrow(cols["living_area"] != 0)
+
+    if is_past:
+        # Only check past data, 'na' and other unreadable dates become NaT
+        cols["date_sold"] = clean_date_series(raw("date_sold"), now)
+        narrow(cols["date_sold"].notna())
+
+    # No more rows are dropped from here on
+    cols["price_m2"] = round(cols["price"] / cols["living_area"], 1)
 
     # Location
-    df["zip"] = df["zip_code"].apply(lambda x: x[:4])
+    cols["zip"] = raw("zip_code").astype(STRING_DTYPE).str[:4].astype(object)
 
     # House layout
-    df["room"] = df["num_of_rooms"].apply(find_n_room)
-    df["bedroom"] = df["num_of_rooms"].apply(find_n_bedroom)
-    df["bathroom"] = df["num_of_bathrooms"].apply(find_n_bathroom)
-    df["energy_label"] = df["energy_label"].apply(clean_energy_label)
+    layout = parse_layout_frame(raw("num_of_rooms"))
+    cols["room"] = layout["room"]
+    cols["bedroom"] = layout["bedroom"]
+    cols["bathroom"] = find_n_bathroom_series(raw("num_of_bathrooms"))
+
+    # Columns with few distinct values, e.g. energy labels, become categories
+    for col in config.category_cols:
+        if col in keep_cols and col in df.columns:
+            cols[col] = normalise_series(raw(col), CATEGORY_CLEANERS.get(col))
 
     # Time
-    df["year_built"] = df["year"].apply(clean_year).astype(int)
-    df["house_age"] = datetime.now().year - df["year_built"]
+    cols["year_built"] = normalise_series(
+        raw("year"), clean_year_series, categorical=False
+    ).astype("int64")
+    cols["house_age"] = now.year - cols["year_built"]
 
     if is_past:
-        # Only check past data
-        df = df[df["date_sold"] != "na"]
-        df["date_sold"] = df["date_sold"].apply(clean_date_format)
-        df = df.dropna()
-        df["date_sold"] = pd.to_datetime(df["date_sold"])
-        df["ym_sold"] = df["date_sold"].apply(lambda x: x.to_period("M").to_timestamp())
-        df["year_sold"] = df["date_sold"].apply(lambda x: x.year)
+        cols["ym_sold"] = cols["date_sold"].dt.to_period("M").dt.to_timestamp()
+        cols["year_sold"] = cols["date_sold"].dt.year.astype("int64")
+
+    clean = pd.DataFrame(
+        {col: cols[col] if col in cols else raw(col) for col in keep_cols}, copy=False
+    )
+    clean["house_id"] = clean["house_id"].astype("int64")
+    if config.dtypes.enabled:
+        clean = apply_dtype_policy(clean)
+    return clean
+
+def preprocess_chunked(
+    df: pd.DataFrame,
+    is_past: bool,
+    keep_extra_cols: List[str] = None,
+    now: Optional[datetime] = None,
+    chunk_size: Optional[int] = None,
+    workers: int = 0,
+) -> pd.DataFrame:
+    """
+    Clean a large raw dataframe in blocks of rows, spread over several processes.
 
-    return df[keep_cols].reset_index(drop=True)
+    Every block is cleaned by preprocess_data on its own, all against the same
+    `now`, and the blocks are put back together in their original order. The
+    dtypes are settled once more on the whole result, since a column may be
+    stored as a category in one block and as strings in another.
 
-async def async_preprocess_data(df, is_past, keep_extra_cols=None):
+    :param df: raw dataframe from scraping
+    :param is_past: whether it scraped past data
+    :param keep_extra_cols: specify additional column names to keep in the final df
+    :param now: the moment relative dates and ages are counted from, defaults to now
+    :param chunk_size: rows per block, defaults to the config
+    :param workers: how many processes clean the blocks, 0 to clean the whole
+        dataframe at once in this process
+    :return: clean dataframe
+    """
+    now = datetime.now() if now is None else now
+    chunk_size = max(config.preprocess.chunk_size if chunk_size is None else chunk_size, 1)
+    clean_chunk = partial(
+        preprocess_data, is_past=is_past, keep_extra_cols=keep_extra_cols, now=now
+    )
+    if workers < 1 or len(df) <= chunk_size:
+        return clean_chunk(df)
+
+    chunks = (df.iloc[i : i + chunk_size] for i in range(0, len(df), chunk_size))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map keeps the order of the blocks, whichever process finishes first
+        parts = list(pool.map(clean_chunk, chunks))
+
+    clean = pd.concat(parts, ignore_index=True)
+    # Blocks have categories of their own, which concat turns into objects
+    for col in clean.columns:
+        if all(isinstance(part[col].dtype, pd.CategoricalDtype) for part in parts):
+            clean[col] = union_categoricals([part[col] for part in parts])
+
+    if config.dtypes.enabled:
+        clean = apply_dtype_policy(clean)
+    return clean
+
+
+async def async_preprocess_data(
+    df, is_past, keep_extra_cols=None, chunk_size=None, workers=0
+):
     loop = asyncio.get_running_loop()
     with ThreadPoolExecutor() as pool:
-        # Run preprocess_data in a separate thread
-        return await loop.run_in_executor(pool, preprocess_data, df, is_past, keep_extra_cols)
\ No newline at end of file
+        # Run preprocess_chunked in a separate thread, which waits for the
+        # processes if there are any
+        return await loop.run_in_executor(
+            pool,
+            partial(
+                preprocess_chunked,
+                df,
+                is_past,
+                keep_extra_cols,
+                chunk_size=chunk_size,
+                workers=workers,
+            ),
+        )
@@ -3,23 +3,60 @@ import argparse
 import datetime
 import json
 import asyncio
-import random
 import os
-from typing import List, Optional
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+)
 
 import pandas as pd
 import aiofiles
 import aiohttp
 import requests
 from io import StringIO
-from bs4 import BeautifulSoup
 from tqdm.asyncio import tqdm as atqdm
 from tqdm import tqdm
-from tqdm.contrib.concurrent import process_map
 
+from funda_scraper.cache import ResponseCache
+from funda_scraper.checkpoint import Checkpoint
 from funda_scraper.config.core import config
-from funda_scraper.preprocess import clean_date_format, async_preprocess_data
-from funda_scraper.utils import logger
+from funda_scraper.dtypes import apply_dtype_policy
+from funda_scraper.extract import (
+    LD_JSON_PATTERN,
+    find_ld_json,
+    get_extractor,
+    get_value_from_css,
+    parse_listing,
+)
+from funda_scraper.fetch import (
+    AdaptiveConcurrency,
+    FetchResult,
+    RetryPolicy,
+    TokenBucket,
+    build_session,
+    parse_retry_after,
+    read_until,
+)
+from funda_scraper.preprocess import async_preprocess_data
+from funda_scraper.sinks import Sink, open_sink
+from funda_scraper.storage import write_parquet
+from funda_scraper.utils import logger, str_to_bool
+
+# Receives the position of a link and the result of scraping it
+EmitFn = Callable[[int, Optional[List[str]]], Awaitable[None]]
+
+# Only filled in for listings that are no longer available
+SOLD_ONLY_COLS = ["term", "price_sold", "date_sold"]
 
 
 class FundaScraper(object):
@@ -37,6 +74,20 @@ class FundaScraper(object):
         max_price: Optional[int] = None,
         days_since: Optional[int] = None,
         property_type: Optional[str] = None,
+        max_concurrency: int = 10,
+        requests_per_second: Optional[float] = 5.0,
+        burst: int = 5,
+        jitter: float = 0.0,
+        adaptive_concurrency: bool = True,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache_path: Optional[str] = None,
+        checkpoint_path: Optional[str] = None,
+        parse_workers: int = 0,
+        preprocess_workers: int = 0,
+        parser_backend: str = "lxml",
+        single_pass: bool = False,
+        partial_parse: bool = False,
+        structured_data: bool = False,
     ):
         # Init attributes
         self.area = area.lower().replace(" ", "-")
@@ -49,13 +100,45 @@ class FundaScraper(object):
         self.min_price = min_price
         self.max_price = max_price
         self.days_since = days_since
+        self.max_concurrency = max(max_concurrency, 1)
+        self.rate_limiter = (
+            None
+            if requests_per_second is None
+            else TokenBucket(requests_per_second, burst=burst, jitter=jitter)
+        )
+        self.concurrency = (
+            AdaptiveConcurrency(self.max_concurrency, **config.adaptive_concurrency)
+            if adaptive_concurrency
+            else None
+        )
+        self.retry_policy = (
+            RetryPolicy(**config.retry) if retry_policy is None else retry_policy
+        )
+        self.cache = None if cache_path is None else ResponseCache(cache_path)
+        self.checkpoint = None if checkpoint_path is None else Checkpoint(checkpoint_path)
+        self.parse_workers = max(parse_workers, 0)
+        self.preprocess_workers = max(preprocess_workers, 0)
+        self.parser_backend = get_extractor(parser_backend).name
+        self.single_pass = single_pass
+        self.partial_parse = partial_parse
+        if partial_parse and self.parser_backend != "bs4":
+            logger.warning(
+                f"*** partial_parse only applies to the bs4 backend, "
+                f"it has no effect with {self.parser_backend} ***"
+            )
+        self.structured_data = structured_data
 
         # Instantiate along the way
         self.links: List[str] = []
+        self.failed_links: List[str] = []
         self.raw_df = pd.DataFrame()
         self.clean_df = pd.DataFrame()
         self.base_url = config.base_url
         self.selectors = config.css_selector
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Cache and checkpoint writes compress and commit, so keep them off the loop
+        self._store_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="funda-store")
 
     def __repr__(self):
         return (f"FundaScraper(area={self.area}, "
@@ -153,171 +236,577 @@ class FundaScraper(object):
         logger.info(f"*** Main URL: {main_url} ***")
         return main_url
 
-    @staticmethod
-    def get_value_from_css(soup: BeautifulSoup, selector: str) -> str:
-        """Use CSS selector to find certain features."""
-        result = soup.select(selector)
-        if len(result) > 0:
-            result = result[0].text
-        else:
-            result = "na"
+    get_value_from_css = staticmethod(get_value_from_css)
+
+    @asynccontextmanager
+    async def _session_scope(self) -> AsyncIterator[aiohttp.ClientSession]:
+        """Reuse the open session, or own one for the duration of the block."""
+        if self._session is not None and not self._session.closed:
+            yield self._session
+            return
+
+        self._session = build_session()
+        try:
+            yield self._session
+        finally:
+            await self._session.close()
+            self._session = None
+
+    async def _store(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Call a cache or checkpoint method on the one thread doing their I/O."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._store_io, fn, *args)
+
+    async def _fetch(self, url: str, kind: str = "detail") -> Optional[str]:
+        """
+        Download one page with the shared session, or None if it failed.
+
+        :param url: the page to download
+        :param kind: the kind of page, 'search' or 'detail', which sets its cache TTL
+        :return: the body of the page
+        """
+        if self.cache is None:
+            result = await self._download(url, kind)
+            return result.text if result.status == 200 else None
+
+        cached = await self._store(self.cache.get, url)
+        if cached is not None and self.cache.is_fresh(cached):
+            return cached.body
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        result = await self._download(url, kind, headers)
+        if result.status == 304 and cached is not None:
+            await self._store(self.cache.touch, url)
+            return cached.body
+        if result.status != 200:
+            return None
+        await self._store(
+            self.cache.put, url, kind, result.text, result.etag, result.last_modified
+        )
+        return result.text
+
+    async def _download(
+        self, url: str, kind: str, headers: Optional[Dict[str, str]] = None
+    ) -> FetchResult:
+        """Send a request, retrying it according to the retry policy."""
+        policy = self.retry_policy
+        first_attempt = time.monotonic()
+        for attempt in range(1, policy.max_attempts + 1):
+            if self.concurrency is None:
+                result = await self._fetch_once(url, kind, headers)
+            else:
+                async with self.concurrency:
+                    result = await self._fetch_once(url, kind, headers)
+
+            if result.status in (200, 304):
+                return result
+            if not policy.is_retryable(result.status):
+                logger.error(f"Failed to fetch {url}: HTTP {result.status}")
+                return result
+
+            # Back off outside of the concurrency slot
+            delay = policy.delay(attempt, result.retry_after)
+            elapsed = time.monotonic() - first_attempt
+            if attempt == policy.max_attempts or elapsed + delay > policy.budget:
+                break
+            logger.warning(
+                f"Retrying {url} in {delay:.1f}s after HTTP {result.status} (attempt {attempt})"
+            )
+            await asyncio.sleep(delay)
+
+        logger.error(f"Giving up on {url} after {attempt} attempts: HTTP {result.status}")
+        # Only listing pages get a second pass at the end of phase 2
+        if kind == "detail" and url not in self.failed_links:
+            self.failed_links.append(url)
+        return result
+
+    async def _fetch_once(
+        self, url: str, kind: str, headers: Optional[Dict[str, str]] = None
+    ) -> FetchResult:
+        """Send one rate-limited request and report its outcome for adaptation."""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+
+        # Search pages are only read up to the end of their JSON-LD
+        until = LD_JSON_PATTERN if kind == "search" else None
+
+        start = time.monotonic()
+        result = FetchResult(status=None)
+        try:
+            if self._session is None or self._session.closed:
+                # Called outside of a run, e.g. scrape_one_link on its own
+                async with build_session() as session:
+                    result = await self._get(session, url, headers, until)
+            else:
+                result = await self._get(self._session, url, headers, until)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Request to {url} failed: {e!r}")
+        finally:
+            if self.concurrency is not None:
+                self.concurrency.record(result.status, time.monotonic() - start)
         return result
 
     @staticmethod
-    async def _get_links_from_one_parent(url: str) -> List[str]:
+    async def _get(
+        session: aiohttp.ClientSession,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        until: Optional[Pattern[str]] = None,
+    ) -> FetchResult:
+        """
+        Send one GET request and collect what the fetch layer needs from it.
+
+        :param until: if given, stop reading the body at the first match of it
+        """
+        async with session.get(url, headers=headers) as response:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status != 200:
+                return FetchResult(response.status, retry_after=retry_after)
+            if until is None:
+                text = await response.text()
+            else:
+                text = await read_until(response, until)
+            return FetchResult(
+                response.status,
+                text,
+                retry_after,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+
+    async def _get_links_from_one_parent(self, url: str) -> List[str]:
         """Scrape all the available housing items from one Funda search page."""
         try:
-            async with aiohttp.ClientSession(headers=config.header) as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to fetch {url}: HTTP {response.status}")
-                        return []
-                    response_text = await response.text()
-                    
-                    # Introduce a random delay
-                    await asyncio.sleep(random.uniform(0.5, 2))
-
-            soup = BeautifulSoup(response_text, "lxml")
-            script_tags = soup.find_all("script", {"type": "application/ld+json"})
-            if not script_tags:
+            if self.checkpoint is not None:
+                links = await self._store(self.checkpoint.get_links, url)
+                if links is not None:
+                    return links
+
+            response_text = await self._fetch(url, kind="search")
+            if response_text is None:
+                return []
+
+            # Only the JSON-LD is needed, so the page is not parsed as a whole
+            ld_json = find_ld_json(response_text)
+            if not ld_json:
                 logger.warning(f"No script tags found in {url}")
                 return []
 
-            json_data = json.loads(script_tags[0].contents[0])
-            urls = [item["url"] for item in json_data["itemListElement"]]
-            return list(set(urls))
+            json_data = json.loads(ld_json[0])
+            urls = list(set(item["url"] for item in json_data["itemListElement"]))
+            if self.checkpoint is not None:
+                await self._store(self.checkpoint.put_links, url, urls)
+            return urls
 
         except Exception as e:
             logger.error(f"Error fetching links from {url}: {e}")
             return []
 
 
-    async def fetch_all_links(self, page_start: int = None, n_pages: int = None) -> None:
-        """Find all the available links across multiple pages asynchronously."""
+    async def fetch_all_links(
+        self,
+        page_start: int = None,
+        n_pages: int = None,
+        queue: Optional[asyncio.Queue] = None,
+        resume: bool = False,
+    ) -> None:
+        """
+        Find all the available links across multiple pages asynchronously.
+
+        :param page_start: the first search page, defaults to self.page_start
+        :param n_pages: the number of search pages, defaults to self.n_pages
+        :param queue: if given, every new link is also put in it as (index, link)
+            as soon as its search page is parsed
+        :param resume: if true, skip the search pages already recorded in the
+            checkpoint, otherwise forget them first
+        """
+        self._prepare_checkpoint(resume, listings=False)
+        await self._fetch_links(page_start, n_pages, queue)
 
+    async def _fetch_links(
+        self,
+        page_start: Optional[int] = None,
+        n_pages: Optional[int] = None,
+        queue: Optional[asyncio.Queue] = None,
+    ) -> None:
+        """fetch_all_links, on a checkpoint already prepared by the entry point."""
         page_start = self.page_start if page_start is None else page_start
         n_pages = self.n_pages if n_pages is None else n_pages
 
         logger.info("*** Phase 1: Fetch all the available links from all pages *** ")
         main_url = self._build_main_query_url()
 
-        tasks = []
-        for i in range(page_start, page_start + n_pages):
-            url = f"{main_url}&search_result={i}"
-            tasks.append(self._get_links_from_one_parent(url))
+        # Deduplicate on the fly, keeping the order in which links are found
+        urls: Dict[str, None] = {}
+        async with self._session_scope():
+            tasks = []
+            for i in range(page_start, page_start + n_pages):
+                url = f"{main_url}&search_result={i}"
+                tasks.append(self._get_links_from_one_parent(url))
 
-        urls = []
-        async for item_list in atqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Fetching Links"):
-            try:
-                urls += await item_list
-            except IndexError:
-                self.page_end = i
-                logger.info(f"*** The last available page is {self.page_end} ***")
-                break
+            async for item_list in atqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Fetching Links"):
+                try:
+                    item_list = await item_list
+                except IndexError:
+                    self.page_end = i
+                    logger.info(f"*** The last available page is {self.page_end} ***")
+                    break
+
+                for url in item_list:
+                    if url not in urls:
+                        if queue is not None:
+                            queue.put_nowait((len(urls), url))
+                        urls[url] = None
 
-        urls = list(set(urls))
         logger.info(f"*** Got all the urls. {len(urls)} houses found from {self.page_start} to {self.page_end} ***")
-        self.links = urls
+        self.links = list(urls)
+
+    def _prepare_checkpoint(
+        self, resume: bool, pages: bool = True, listings: bool = True
+    ) -> None:
+        """
+        Start the checkpoint afresh, unless resuming from it.
+
+        Every entry point calls this first, so that recorded work is only
+        reused when asked for.
+
+        :param resume: whether to keep the recorded work
+        :param pages: whether a fresh start forgets the search pages
+        :param listings: whether a fresh start forgets the listing pages
+        """
+        if self.checkpoint is None:
+            if resume:
+                raise ValueError("'resume' requires a 'checkpoint_path'.")
+        elif resume:
+            logger.info(f"*** Resuming from {len(self.checkpoint)} scraped listings ***")
+        else:
+            self.checkpoint.clear(pages=pages, listings=listings)
+
+    def _list_since_selector(self) -> str:
+        """The CSS selector of the listing date, which depends on the search."""
+        if self.to_buy:
+            if self.find_past:
+                return self.selectors.date_list
+            return self.selectors.listed_since
+        if self.find_past:
+            return ".fd-align-items-center:nth-child(9) span"
+        return ".fd-align-items-center:nth-child(7) span"
+
+    @asynccontextmanager
+    async def _parser_scope(self) -> AsyncIterator[Optional[ProcessPoolExecutor]]:
+        """Reuse the open process pool, or own one for the duration of the block."""
+        if self.parse_workers < 1 or self._executor is not None:
+            yield self._executor
+            return
 
+        self._executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+        try:
+            yield self._executor
+        finally:
+            self._executor.shutdown()
+            self._executor = None
 
     async def scrape_one_link(self, link: str) -> List[str]:
         """Scrape all the features from one house item given a link."""
         try:
-            async with aiohttp.ClientSession(headers=config.header) as session:
-                async with session.get(link) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to fetch {link}: HTTP {response.status}")
-                        return []
-                    response_text = await response.text()
-
-            soup = BeautifulSoup(response_text, "lxml")
-
-            # Get the value according to respective CSS selectors
-            if self.to_buy:
-                if self.find_past:
-                    list_since_selector = self.selectors.date_list
-                else:
-                    list_since_selector = self.selectors.listed_since
-            else:
-                if self.find_past:
-                    list_since_selector = ".fd-align-items-center:nth-child(9) span"
-                else:
-                    list_since_selector = ".fd-align-items-center:nth-child(7) span"
+            if self.checkpoint is not None:
+                row = await self._store(self.checkpoint.get_row, link)
+                if row is not None:
+                    return row
 
-            result = [
-                link,
-                self.get_value_from_css(soup, self.selectors.price),
-                self.get_value_from_css(soup, self.selectors.address),
-                self.get_value_from_css(soup, self.selectors.descrip),
-                self.get_value_from_css(soup, list_since_selector),
-                self.get_value_from_css(soup, self.selectors.zip_code),
-                self.get_value_from_css(soup, self.selectors.size),
-                self.get_value_from_css(soup, self.selectors.year),
-                self.get_value_from_css(soup, self.selectors.living_area),
-                self.get_value_from_css(soup, self.selectors.kind_of_house),
-                self.get_value_from_css(soup, self.selectors.building_type),
-                self.get_value_from_css(soup, self.selectors.num_of_rooms),
-                self.get_value_from_css(soup, self.selectors.num_of_bathrooms),
-                self.get_value_from_css(soup, self.selectors.layout),
-                self.get_value_from_css(soup, self.selectors.energy_label),
-                self.get_value_from_css(soup, self.selectors.insulation),
-                self.get_value_from_css(soup, self.selectors.heating),
-                self.get_value_from_css(soup, self.selectors.ownership),
-                self.get_value_from_css(soup, self.selectors.exteriors),
-                self.get_value_from_css(soup, self.selectors.parking),
-                self.get_value_from_css(soup, self.selectors.neighborhood_name),
-                self.get_value_from_css(soup, self.selectors.date_list),
-                self.get_value_from_css(soup, self.selectors.date_sold),
-                self.get_value_from_css(soup, self.selectors.term),
-                self.get_value_from_css(soup, self.selectors.price_sold),
-                self.get_value_from_css(soup, self.selectors.last_ask_price),
-                self.get_value_from_css(soup, self.selectors.last_ask_price_m2).split("\r")[
-                    0
-                ],
-            ]
+            response_text = await self._fetch(link, kind="detail")
+            if response_text is None:
+                return []
 
-            # Deal with list_since_selector especially, since its CSS varies sometimes
-            if clean_date_format(result[4]) == "na":
-                for i in range(6, 16):
-                    selector = f".fd-align-items-center:nth-child({i}) span"
-                    update_list_since = self.get_value_from_css(soup, selector)
-                    if clean_date_format(update_list_since) == "na":
-                        pass
-                    else:
-                        result[4] = update_list_since
-
-            photos_list = [
-                p.get("data-lazy-srcset") for p in soup.select(self.selectors.photo)
-            ]
-            photos_string = ", ".join(photos_list)
+            job = (
+                response_text,
+                link,
+                self._list_since_selector(),
+                self.parser_backend,
+                self.single_pass,
+                self.partial_parse,
+                self.structured_data,
+            )
+            if self._executor is None:
+                row = parse_listing(*job)
+            else:
+                # Keep the event loop free for the network while pages are parsed
+                loop = asyncio.get_running_loop()
+                row = await loop.run_in_executor(self._executor, parse_listing, *job)
 
-            # Clean up the retried result from one page
-            result = [r.replace("\n", "").replace("\r", "").strip() for r in result]
-            result.append(photos_string)
-            return result
+            if self.checkpoint is not None:
+                await self._store(self.checkpoint.put_row, link, row)
+            return row
         except Exception as e:
             logger.error(f"Error scraping {link}: {e}")
             return None
 
-    async def scrape_pages(self) -> None:
-        """Scrape all the content acoss multiple pages."""
+    async def _scrape_worker(self, queue: asyncio.Queue, emit: EmitFn) -> None:
+        """Keep scraping links from the queue, handing each result to emit."""
+        while True:
+            i, link = await queue.get()
+            try:
+                await emit(i, await self.scrape_one_link(link))
+            finally:
+                queue.task_done()
+
+    def _start_workers(
+        self, queue: asyncio.Queue, emit: EmitFn, n_workers: int
+    ) -> List[asyncio.Task]:
+        """Start a fixed pool of workers, so at most n_workers pages are in flight."""
+        return [
+            asyncio.create_task(self._scrape_worker(queue, emit))
+            for _ in range(n_workers)
+        ]
+
+    @staticmethod
+    async def _stop_workers(workers: List[asyncio.Task]) -> None:
+        """Cancel the workers and wait for them to finish."""
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    @staticmethod
+    async def _watch_workers(aw: Awaitable[None], workers: List[asyncio.Task]) -> None:
+        """
+        Wait for aw, or raise the error of the first worker that dies before it ends.
+
+        Workers only stop by failing, and a pool that died would otherwise leave
+        queue.join() waiting forever.
+        """
+        main = asyncio.ensure_future(aw)
+        try:
+            done, _ = await asyncio.wait(
+                [main, *workers], return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            if not main.done():
+                main.cancel()
+                await asyncio.gather(main, return_exceptions=True)
+        if main in done:
+            main.result()
+            return
+        for w in done:
+            w.result()
+
+    @classmethod
+    async def _join_workers(cls, queue: asyncio.Queue, workers: List[asyncio.Task]) -> None:
+        """Wait until the queue is drained, then stop the workers."""
+        try:
+            await cls._watch_workers(queue.join(), workers)
+        finally:
+            await cls._stop_workers(workers)
+
+    async def _scrape_links(
+        self, links: List[str], max_concurrency: int, emit: EmitFn, offset: int = 0
+    ) -> None:
+        """Scrape the links with a fixed pool of workers, numbering them from offset."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for i, link in enumerate(links):
+            queue.put_nowait((offset + i, link))
+
+        workers = self._start_workers(queue, emit, min(max_concurrency, len(links)))
+        await self._join_workers(queue, workers)
+
+    async def _retry_failed_links(self, emit: EmitFn, offset: int) -> None:
+        """Give the links that ran out of retries one more pass, more gently."""
+        if not self.failed_links:
+            return
+
+        retry_links, self.failed_links = self.failed_links, []
+        logger.info(f"*** Retrying {len(retry_links)} failed links ***")
+        await self._scrape_links(
+            retry_links, max(self.max_concurrency // 4, 1), emit, offset
+        )
+        if self.failed_links:
+            logger.warning(f"*** {len(self.failed_links)} links could not be scraped ***")
+
+    async def _crawl(self, emit: EmitFn) -> None:
+        """
+        Scrape the listing pages while the search pages are still being fetched.
+
+        Each search page pushes its new links into a queue that the phase 2 workers
+        consume straight away, so the two phases overlap instead of running one
+        after the other.
+        """
+        self.failed_links = []
+        queue: asyncio.Queue = asyncio.Queue()
+        logger.info("*** Phase 1 and 2: Scrape individual links as soon as they are found ***")
+        workers = self._start_workers(queue, emit, self.max_concurrency)
+
+        async def feed() -> None:
+            await self._fetch_links(queue=queue)
+            await queue.join()
+
+        try:
+            await self._watch_workers(feed(), workers)
+        finally:
+            # Not joined on errors, workers may be blocked on a consumer that is gone
+            await self._stop_workers(workers)
+        await self._retry_failed_links(emit, offset=len(self.links))
+
+    def _build_raw_df(self, content: List[Optional[List[str]]]) -> pd.DataFrame:
+        """Put the scraped results together into the raw dataframe."""
+        # Build the frame in one go, appending row by row is quadratic
+        rows = [c for c in content if c]
+        df = pd.DataFrame(rows, columns=list(self.selectors.keys()), dtype=object)
 
-        logger.info("*** Phase 2: Start scraping from individual links ***")
-        df = pd.DataFrame({key: [] for key in self.selectors.keys()})
-
-        # Creating async tasks for each link
-        scrape_tasks = [self.scrape_one_link(link) for link in self.links]
-        content = await asyncio.gather(*scrape_tasks)
-        
-        for i, c in enumerate(content):
-            df.loc[len(df)] = c
-            
         df["city"] = df["url"].map(lambda x: x.split("/")[4])
         df["log_id"] = datetime.datetime.now().strftime("%Y%m-%d%H-%M%S")
         if not self.find_past:
-            df = df.drop(["term", "price_sold", "date_sold"], axis=1)
+            df = df.drop(SOLD_ONLY_COLS, axis=1)
+        if config.dtypes.enabled:
+            df = apply_dtype_policy(df)
         logger.info(f"*** All scraping done: {df.shape[0]} results ***")
-        self.raw_df = df
+        return df
+
+    def _to_listing(self, row: List[str], log_id: str) -> Dict[str, Any]:
+        """One scraped result with the same columns as a row of the raw dataframe."""
+        listing = dict(zip(self.selectors.keys(), row))
+        listing["city"] = listing["url"].split("/")[4]
+        listing["log_id"] = log_id
+        if not self.find_past:
+            for col in SOLD_ONLY_COLS:
+                del listing[col]
+        return listing
+
+    def _collector(
+        self, content: Dict[int, Optional[List[str]]], sink: Optional[Sink] = None
+    ) -> EmitFn:
+        """Keep every result in content and, if given, write it to the sink as well."""
+        log_id = datetime.datetime.now().strftime("%Y%m-%d%H-%M%S")
+
+        async def collect(i: int, row: Optional[List[str]]) -> None:
+            content[i] = row
+            if sink is not None and row:
+                await sink.awrite(self._to_listing(row, log_id))
+
+        return collect
+
+    async def scrape_pages(self, sink: Optional[Sink] = None, resume: bool = False) -> None:
+        """
+        Scrape all the content acoss multiple pages.
+
+        :param sink: if given, listings are also written to it while scraping
+        :param resume: if true, skip the listings already recorded in the
+            checkpoint, otherwise forget them first
+        """
+        self._prepare_checkpoint(resume, pages=False)
+
+        logger.info("*** Phase 2: Start scraping from individual links ***")
+        content: Dict[int, Optional[List[str]]] = {}
+        collect = self._collector(content, sink)
+
+        self.failed_links = []
+        async with self._session_scope(), self._parser_scope():
+            await self._scrape_links(self.links, self.max_concurrency, collect)
+            await self._retry_failed_links(collect, offset=len(self.links))
+        if sink is not None:
+            await sink.aflush()
+        self.raw_df = self._build_raw_df([content[i] for i in sorted(content)])
+
+    async def fetch_and_scrape(self, sink: Optional[Sink] = None, resume: bool = False) -> None:
+        """
+        Scrape all the links while they are being found, into self.raw_df.
+
+        :param sink: if given, listings are also written to it while scraping
+        :param resume: if true, skip the pages already recorded in the checkpoint,
+            otherwise start the checkpoint afresh
+        """
+        self._prepare_checkpoint(resume)
+        content: Dict[int, Optional[List[str]]] = {}
+        collect = self._collector(content, sink)
+
+        async with self._session_scope(), self._parser_scope():
+            await self._crawl(collect)
+        if sink is not None:
+            await sink.aflush()
+        self.raw_df = self._build_raw_df([content[i] for i in sorted(content)])
+
+    async def write_listings(self, sink: Sink, buffer_size: int = 100, resume: bool = False) -> int:
+        """
+        Crawl straight into a sink without keeping the listings in memory.
+
+        :param sink: where the listings go, closed at the end
+        :param buffer_size: how many scraped listings may wait to be written
+        :param resume: if true, skip the pages already recorded in the checkpoint,
+            otherwise start the checkpoint afresh
+        :return: the number of listings written
+        """
+        async with sink:
+            async for listing in self.iter_listings(buffer_size, resume):
+                await sink.awrite(listing)
+        logger.info(f"*** {sink.n_rows} listings written to {sink.path} ***")
+        return sink.n_rows
+
+    async def iter_listings(
+        self, buffer_size: int = 100, resume: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield every listing as soon as it is scraped.
+
+        Listings come as dicts with the columns of the raw dataframe, in the order
+        they finish. At most buffer_size of them wait for the consumer; beyond that
+        the workers pause, so memory stays flat however many pages are crawled.
+        Nothing is kept in self.raw_df.
+
+        :param buffer_size: how many scraped listings may wait to be consumed
+        :param resume: if true, skip the pages already recorded in the checkpoint,
+            otherwise start the checkpoint afresh
+        """
+        self._prepare_checkpoint(resume)
+        rows: asyncio.Queue = asyncio.Queue(maxsize=max(buffer_size, 1))
+        done = object()
+        log_id = datetime.datetime.now().strftime("%Y%m-%d%H-%M%S")
+
+        async def emit(i: int, row: Optional[List[str]]) -> None:
+            if row:
+                await rows.put(row)
+
+        async def produce() -> None:
+            try:
+                await self._crawl(emit)
+            except Exception:
+                # Wake up the consumer, the error is raised again when awaited
+                await rows.put(done)
+                raise
+            await rows.put(done)
+
+        async with self._session_scope(), self._parser_scope():
+            producer = asyncio.create_task(produce())
+            try:
+                while True:
+                    row = await rows.get()
+                    if row is done:
+                        break
+                    yield self._to_listing(row, log_id)
+                # Surface any error of the crawl
+                await producer
+            finally:
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+
+    def iter_listings_sync(
+        self, buffer_size: int = 100, resume: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """Synchronous version of iter_listings, for use outside of an event loop."""
+        loop = asyncio.new_event_loop()
+        listings = self.iter_listings(buffer_size, resume)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(listings.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(listings.aclose())
+            loop.close()
 
     def save_csv(self, df: pd.DataFrame, filepath: str = None) -> None:
         """Save the result to a .csv file."""
@@ -330,29 +819,68 @@ class FundaScraper(object):
         df.to_csv(filepath, index=False)
         logger.info(f"*** File saved: {filepath}. ***")
 
+    def save_parquet(
+        self,
+        df: pd.DataFrame,
+        root: str = None,
+        compression: Optional[str] = None,
+        row_group_size: Optional[int] = None,
+    ) -> None:
+        """
+        Add the result to a Parquet dataset partitioned by city, want_to and date.
+
+        :param root: the directory of the dataset, defaults to ./data/parquet
+        :param compression: parquet codec, defaults to the config
+        :param row_group_size: maximum number of rows per row group, defaults to the config
+        """
+        if root is None:
+            self._check_dir()
+            root = "./data/parquet"
+        want_to = "buy" if self.to_buy else "rent"
+        write_parquet(df, root, want_to, compression=compression, row_group_size=row_group_size)
+        logger.info(f"*** Dataset updated: {root}. ***")
+
     async def run(
-        self, raw_data: bool = False, save: bool = False, filepath: str = None
+        self,
+        raw_data: bool = False,
+        save: bool = False,
+        filepath: str = None,
+        resume: bool = False,
+        file_format: str = "csv",
+        sink: Optional[Sink] = None,
     ) -> pd.DataFrame:
         """
         Scrape all links and all content.
 
         :param raw_data: if true, the data won't be pre-processed
-        :param save: if true, the data will be saved as a csv file
-        :param filepath: the name for the file
+        :param save: if true, the data will be saved
+        :param filepath: the name for the file, or the directory of the dataset for parquet
+        :param resume: if true, skip the pages already recorded in the checkpoint,
+            otherwise start the checkpoint afresh
+        :param file_format: 'csv' for one file, or 'parquet' to add the data to a
+            dataset partitioned by city, want_to and date
+        :param sink: if given, the raw listings are also written to it while
+            scraping, so partial results survive a crash
         :return: the (pre-processed) dataframe from scraping
         """
-        await self.fetch_all_links()
-        await self.scrape_pages()
+        await self.fetch_and_scrape(sink, resume)
 
         if raw_data:
             df = self.raw_df
         else:
             logger.info("*** Cleaning data ***")
-            df = await async_preprocess_data(df=self.raw_df, is_past=self.find_past)
+            df = await async_preprocess_data(
+                df=self.raw_df, is_past=self.find_past, workers=self.preprocess_workers
+            )
             self.clean_df = df
 
         if save:
-            self.save_csv(df, filepath)
+            if file_format == "parquet":
+                self.save_parquet(df, filepath)
+            elif file_format == "csv":
+                self.save_csv(df, filepath)
+            else:
+                raise ValueError("'file_format' must be either 'csv' or 'parquet'.")
 
         logger.info("*** Done! ***")
         return df
@@ -367,9 +895,33 @@ async def main():
         min_price=args.min_price,
         max_price=args.max_price,
         days_since=args.days_since,
+        max_concurrency=args.max_concurrency,
+        requests_per_second=args.requests_per_second,
+        burst=args.burst,
+        jitter=args.jitter,
+        adaptive_concurrency=args.adaptive_concurrency,
+        cache_path=args.cache_path,
+        checkpoint_path=args.checkpoint_path,
+        parse_workers=args.parse_workers,
+        preprocess_workers=args.preprocess_workers,
+        parser_backend=args.parser_backend,
+        single_pass=args.single_pass,
+        partial_parse=args.partial_parse,
+        structured_data=args.structured_data,
     )
 
-    df = await scraper.run(raw_data=args.raw_data, save=args.save)
+    sink = None if args.stream_to is None else open_sink(args.stream_to)
+    try:
+        df = await scraper.run(
+            raw_data=args.raw_data,
+            save=args.save,
+            resume=args.resume,
+            file_format=args.file_format,
+            sink=sink,
+        )
+    finally:
+        if sink is not None:
+            await sink.aclose()
     print(df.head())
     
 if __name__ == "__main__":
@@ -388,7 +940,7 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--find_past",
-        type=bool,
+        type=str_to_bool,
         help="Indicate whether you want to use hisotrical data or not",
         default=False,
     )
@@ -410,20 +962,119 @@ if __name__ == "__main__":
         help="Specify the days since publication",
         default=None,
     )
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        help="Specify how many detail pages can be scraped at the same time",
+        default=10,
+    )
+    parser.add_argument(
+        "--requests_per_second",
+        type=float,
+        help="Specify the maximum number of requests sent per second, 0 or less for no limit",
+        default=5.0,
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        help="Specify how many requests can be sent at once before the rate limit applies",
+        default=5,
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        help="Specify the maximum random delay in seconds added to each request",
+        default=0.0,
+    )
+    parser.add_argument(
+        "--adaptive_concurrency",
+        type=str_to_bool,
+        help="Indicate whether to adapt concurrency to throttling and latency, up to max_concurrency",
+        default=True,
+    )
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        help="Specify a SQLite file to cache downloaded pages in between runs",
+        default=None,
+    )
+    parser.add_argument(
+        "--checkpoint_path",
+        type=str,
+        help="Specify a SQLite file to record the progress of the crawl in",
+        default=None,
+    )
+    parser.add_argument(
+        "--resume",
+        type=str_to_bool,
+        help="Indicate whether to skip the pages already recorded in the checkpoint",
+        default=False,
+    )
+    parser.add_argument(
+        "--parse_workers",
+        type=int,
+        help="Specify how many processes parse the pages, 0 to parse them in the main process",
+        default=0,
+    )
+    parser.add_argument(
+        "--preprocess_workers",
+        type=int,
+        help="Specify how many processes clean the data in blocks of rows, 0 to clean it in the main process",
+        default=0,
+    )
+    parser.add_argument(
+        "--parser_backend",
+        type=str,
+        help="Specify how listing pages are parsed: 'lxml', 'selectolax' or 'bs4'",
+        default="lxml",
+    )
+    parser.add_argument(
+        "--single_pass",
+        type=str_to_bool,
+        help="Indicate whether to find most features in one walk of the page instead of one CSS query each",
+        default=False,
+    )
+    parser.add_argument(
+        "--partial_parse",
+        type=str_to_bool,
+        help="Indicate whether to only build the parts of a listing page that are scraped, only with the bs4 backend",
+        default=False,
+    )
+    parser.add_argument(
+        "--structured_data",
+        type=str_to_bool,
+        help="Indicate whether to read typed features from the JSON-LD of a listing page first",
+        default=False,
+    )
     parser.add_argument(
         "--raw_data",
-        type=bool,
+        type=str_to_bool,
         help="Indicate whether you want the raw scraping result or preprocessed one",
         default=False,
     )
     parser.add_argument(
         "--save",
-        type=bool,
+        type=str_to_bool,
         help="Indicate whether you want to save the data or not",
         default=True,
     )
+    parser.add_argument(
+        "--file_format",
+        type=str,
+        help="Specify how the data is saved: 'csv' or 'parquet'",
+        default="csv",
+    )
+    parser.add_argument(
+        "--stream_to",
+        type=str,
+        help="Specify a .csv, .jsonl or .parquet path to write the raw listings to while scraping",
+        default=None,
+    )
 
     args = parser.parse_args()
+    # None turns the rate limiter off, which cannot be typed as a float
+    if args.requests_per_second <= 0:
+        args.requests_per_second = None
     scraper = FundaScraper(
         area=args.area,
         want_to=args.want_to,
@@ -433,6 +1084,19 @@ if __name__ == "__main__":
         min_price=args.min_price,
         max_price=args.max_price,
         days_since=args.days_since,
+        max_concurrency=args.max_concurrency,
+        requests_per_second=args.requests_per_second,
+        burst=args.burst,
+        jitter=args.jitter,
+        adaptive_concurrency=args.adaptive_concurrency,
+        cache_path=args.cache_path,
+        checkpoint_path=args.checkpoint_path,
+        parse_workers=args.parse_workers,
+        preprocess_workers=args.preprocess_workers,
+        parser_backend=args.parser_backend,
+        single_pass=args.single_pass,
+        partial_parse=args.partial_parse,
+        structured_data=args.structured_data,
     )
     # Run the scraper within an async context
     asyncio.run(main())
@@ -0,0 +1,266 @@
+"""Incremental writers for listings as they are scraped"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, List, Optional
+
+import pandas as pd
+
+from funda_scraper.config.core import config
+
+
+class Sink(object):
+    """
+    Buffer scraped listings and write them out in batches.
+
+    A batch is flushed once `batch_size` listings are buffered or `flush_interval`
+    seconds have passed since the last flush. Used from async code, a timer
+    flushes the interval even when no listing comes in for a while. Batches are
+    written one at a time by a background thread, so that `awrite` does not
+    block the event loop while the next pages are downloaded.
+    Use the sink as a (async) context manager, or close it when done.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ):
+        """
+        :param path: where to write, created if needed
+        :param batch_size: listings per batch, defaults to the config
+        :param flush_interval: maximum seconds between flushes, defaults to the config
+        """
+        self.path = path
+        self.batch_size = max(config.sink.batch_size if batch_size is None else batch_size, 1)
+        self.flush_interval = (
+            config.sink.flush_interval if flush_interval is None else flush_interval
+        )
+        self.n_rows = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_flush = time.monotonic()
+        # One thread keeps the batches in order
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._timer: Optional[asyncio.Task] = None
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(path={self.path}, "
+            f"batch_size={self.batch_size}, "
+            f"flush_interval={self.flush_interval})")
+
+    def __enter__(self) -> "Sink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "Sink":
+        self._start_timer()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    def _is_due(self) -> bool:
+        return (
+            len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def _start_timer(self) -> None:
+        if self._timer is not None and self._timer.done():
+            # A flush of the timer failed, raise it to the writer
+            timer, self._timer = self._timer, None
+            timer.result()
+        if self._timer is None and self.flush_interval > 0:
+            self._timer = asyncio.get_running_loop().create_task(self._flush_on_interval())
+
+    async def _stop_timer(self) -> None:
+        timer, self._timer = self._timer, None
+        if timer is None:
+            return
+        timer.cancel()
+        try:
+            await timer
+        except asyncio.CancelledError:
+            pass
+
+    async def _flush_on_interval(self) -> None:
+        """Flush the buffer whenever it has waited `flush_interval` seconds."""
+        while True:
+            await asyncio.sleep(self._last_flush + self.flush_interval - time.monotonic())
+            if time.monotonic() - self._last_flush < self.flush_interval:
+                continue
+            if self._buffer:
+                await self.aflush()
+            else:
+                self._last_flush = time.monotonic()
+
+    def _take(self) -> List[Dict[str, Any]]:
+        rows, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        return rows
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        self._write_rows(rows)
+        # Only count the listings that actually made it to disk
+        self.n_rows += len(rows)
+
+    def write(self, listing: Dict[str, Any]) -> None:
+        """Add one listing, flushing the batch if it is due."""
+        self._buffer.append(listing)
+        if self._is_due():
+            self.flush()
+
+    async def awrite(self, listing: Dict[str, Any]) -> None:
+        """Add one listing, flushing the batch in the background if it is due."""
+        self._start_timer()
+        self._buffer.append(listing)
+        if self._is_due():
+            await self.aflush()
+
+    def flush(self) -> None:
+        """Write out the buffered listings."""
+        rows = self._take()
+        if rows:
+            self._writer.submit(self._write_batch, rows).result()
+
+    async def aflush(self) -> None:
+        """Write out the buffered listings without blocking the event loop."""
+        rows = self._take()
+        if rows:
+            loop = asyncio.get_running_loop()
+            # Rows taken from the buffer are written even if the caller is cancelled
+            await asyncio.shield(loop.run_in_executor(self._writer, self._write_batch, rows))
+
+    def close(self) -> None:
+        """Flush what is left and release the file."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            self._writer.shutdown()
+            self._close()
+
+    async def aclose(self) -> None:
+        """Flush what is left without blocking the event loop and release the file."""
+        try:
+            await self._stop_timer()
+            await self.aflush()
+        finally:
+            self._writer.shutdown()
+            self._close()
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def _close(self) -> None:
+        pass
+
+
+class CsvSink(Sink):
+    """Append listings to a CSV file, with a header only if the file is new."""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self._columns: Optional[List[str]] = None
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if self._columns is None:
+            self._columns = list(rows[0])
+        df = pd.DataFrame(rows, columns=self._columns)
+        df.to_csv(self.path, mode="a", header=header, index=False)
+
+
+class JsonlSink(Sink):
+    """Append listings to a file with one JSON object per line."""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        # Opened by the first batch, so that an unused sink holds no file
+        self._file: Optional[IO[str]] = None
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.writelines(
+            json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows
+        )
+        self._file.flush()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class ParquetSink(Sink):
+    """
+    Write every batch of listings to its own file in a Parquet directory.
+
+    Each file is complete as soon as its batch is flushed, so a crash never
+    leaves an unreadable file behind. Values are stored as strings, like in the
+    raw dataframe. The whole directory can be read with `pd.read_parquet(path)`.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None, **kwargs):
+        """
+        :param compression: parquet codec, defaults to the config
+        """
+        super().__init__(path, **kwargs)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.compression = config.parquet.compression if compression is None else compression
+        self._prefix = f"part-{uuid.uuid4().hex}"
+        self._n_files = 0
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(
+                "ParquetSink needs pyarrow, install it with `pip install funda-scraper[parquet]`."
+            ) from e
+
+        columns = list(rows[0])
+        table = pa.table(
+            {
+                col: pa.array(
+                    [None if row.get(col) is None else str(row[col]) for row in rows],
+                    type=pa.string(),
+                )
+                for col in columns
+            }
+        )
+        filename = os.path.join(self.path, f"{self._prefix}-{self._n_files:05d}.parquet")
+        pq.write_table(table, filename, compression=self.compression)
+        self._n_files += 1
+
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+def open_sink(path: str, file_format: Optional[str] = None, **kwargs) -> Sink:
+    """
+    Create the sink for a path, picked by its extension unless a format is given.
+
+    :param path: a .csv or .jsonl file, or a .parquet directory
+    :param file_format: 'csv', 'jsonl' or 'parquet'
+    :param kwargs: passed on to the sink, e.g. batch_size or flush_interval
+    """
+    if file_format is None:
+        file_format = os.path.splitext(path.rstrip("/"))[1].lstrip(".").lower()
+    if file_format not in SINKS:
+        raise ValueError(f"'file_format' must be one of {', '.join(SINKS)}.")
+    return SINKS[file_format](path, **kwargs)
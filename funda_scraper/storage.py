@@ -0,0 +1,112 @@
+"""Partitioned Parquet storage of scraped data"""
+import datetime
+import uuid
+from typing import List, Optional, Sequence, Union
+
+import pandas as pd
+
+from funda_scraper.config.core import config
+
+# Directory levels of a dataset, e.g. city=amsterdam/want_to=buy/date=2024-05-01
+PARTITION_COLS = ["city", "want_to", "date"]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.dataset  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Parquet storage needs pyarrow, install it with `pip install funda-scraper[parquet]`."
+        ) from e
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    # Partition values are always read back as strings, whatever they look like
+    schema = pa.schema([(col, pa.string()) for col in PARTITION_COLS])
+    return ds.partitioning(schema, flavor="hive")
+
+
+def write_parquet(
+    df: pd.DataFrame,
+    root: str,
+    want_to: str,
+    date: Optional[Union[str, datetime.date]] = None,
+    compression: Optional[str] = None,
+    row_group_size: Optional[int] = None,
+) -> None:
+    """
+    Add a dataframe to a Parquet dataset partitioned by city, want_to and date.
+
+    Every call writes new files, so a dataset grows with each scrape and never
+    overwrites earlier ones. The dataframe needs a 'city' column.
+
+    :param df: the scraped (raw or clean) data
+    :param root: the directory of the dataset
+    :param want_to: 'buy' or 'rent'
+    :param date: the scrape date, defaults to today
+    :param compression: parquet codec, e.g. 'snappy', 'zstd', 'gzip' or None,
+        defaults to the config
+    :param row_group_size: maximum number of rows per row group, defaults to the config
+    """
+    _require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    compression = config.parquet.compression if compression is None else compression
+    row_group_size = config.parquet.row_group_size if row_group_size is None else row_group_size
+    date = datetime.date.today() if date is None else date
+
+    df = df.assign(want_to=want_to, date=str(date))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    file_format = ds.ParquetFileFormat()
+    ds.write_dataset(
+        table,
+        root,
+        format=file_format,
+        partitioning=_partitioning(),
+        file_options=file_format.make_write_options(compression=compression),
+        max_rows_per_group=row_group_size,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def read_parquet(
+    root: str,
+    city: Optional[Union[str, Sequence[str]]] = None,
+    want_to: Optional[Union[str, Sequence[str]]] = None,
+    date: Optional[Union[str, datetime.date, Sequence[Union[str, datetime.date]]]] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Read a dataset written by write_parquet.
+
+    Filters on the partition columns only open the matching directories, the
+    rest of the dataset is never scanned.
+
+    :param root: the directory of the dataset
+    :param city: one or more cities to keep
+    :param want_to: 'buy' and/or 'rent'
+    :param date: one or more scrape dates to keep
+    :param columns: the columns to read, defaults to all of them
+    :return: the matching rows
+    """
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning())
+
+    expression = None
+    for col, values in zip(PARTITION_COLS, (city, want_to, date)):
+        if values is None:
+            continue
+        if isinstance(values, (str, datetime.date)):
+            values = [values]
+        condition = ds.field(col).isin([str(v) for v in values])
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
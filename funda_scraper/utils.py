@@ -1,4 +1,5 @@
 """Utilities for modules"""
+import argparse
 import logging
 
 logger = logging.getLogger("funda_scraper")
@@ -9,3 +10,13 @@ ch = logging.StreamHandler()
 ch.setLevel(logging.INFO)
 
 logger.addHandler(ch)
+
+
+def str_to_bool(value: str) -> bool:
+    """Read a boolean command line argument, since bool('False') is True."""
+    lowered = value.strip().lower()
+    if lowered in ("true", "yes", "1", "on"):
+        return True
+    if lowered in ("false", "no", "0", "off"):
+        return False
+    raise argparse.ArgumentTypeError(f"'{value}' is not a boolean, use True or False.")
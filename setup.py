@@ -40,7 +40,10 @@ setup(
     url=URL,
     packages=find_packages(exclude=("tests",)),
     install_requires=list_reqs(),
-    extras_require={},
+    extras_require={
+        "selectolax": ["selectolax>=0.3.21"],
+        "parquet": ["pyarrow>=14.0.0"],
+    },
     include_package_data=True,
     license="gpl-3.0",
     classifiers=[
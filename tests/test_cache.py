@@ -0,0 +1,90 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from funda_scraper.cache import ResponseCache
+from funda_scraper.scrape import FundaScraper
+
+
+class TestResponseCache(object):
+    def test_put_and_get(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), ttl={"detail": 60})
+        cache.put("https://x/1", "detail", "<html>€</html>", etag='"abc"')
+        entry = cache.get("https://x/1")
+        assert entry.body == "<html>€</html>"
+        assert entry.etag == '"abc"'
+        assert cache.is_fresh(entry)
+        assert cache.get("https://x/2") is None
+        assert len(cache) == 1
+
+    def test_expired_entry(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), ttl={"search": 0})
+        cache.put("https://x/1", "search", "body")
+        assert not cache.is_fresh(cache.get("https://x/1"))
+
+
+class TestCachedFetch(object):
+    def test_fresh_and_revalidated_hits(self, tmp_path):
+        calls = []
+
+        async def page(request):
+            calls.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return web.Response(status=304)
+            return web.Response(text="listing", headers={"ETag": '"v1"'})
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/", page)
+            async with TestServer(app) as server:
+                scraper = FundaScraper(
+                    area="amsterdam",
+                    want_to="buy",
+                    requests_per_second=None,
+                    cache_path=str(tmp_path / "cache.db"),
+                )
+                url = str(server.make_url("/"))
+                bodies = [await scraper._fetch(url), await scraper._fetch(url)]
+                scraper.cache.ttl["detail"] = 0
+                bodies.append(await scraper._fetch(url))
+                return bodies
+
+        assert asyncio.run(run()) == ["listing"] * 3
+        # Second call is served from the cache, third one is revalidated
+        assert calls == [None, '"v1"']
+
+    def test_cache_io_off_the_loop(self, tmp_path):
+        import threading
+
+        threads = set()
+
+        async def page(request):
+            return web.Response(text="listing")
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/", page)
+            async with TestServer(app) as server:
+                scraper = FundaScraper(
+                    area="amsterdam",
+                    want_to="buy",
+                    requests_per_second=None,
+                    cache_path=str(tmp_path / "cache.db"),
+                )
+                for name in ("get", "put"):
+                    method = getattr(scraper.cache, name)
+
+                    def record(*args, method=method):
+                        threads.add(threading.current_thread())
+                        return method(*args)
+
+                    setattr(scraper.cache, name, record)
+                url = str(server.make_url("/"))
+                await scraper._fetch(url)
+                return await scraper._fetch(url)
+
+        assert asyncio.run(run()) == "listing"
+        # Compression and commits happen on one thread, not on the event loop's
+        assert len(threads) == 1
+        assert threading.main_thread() not in threads
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from funda_scraper import dtypes
+from funda_scraper.dtypes import apply_dtype_policy, memory_report, to_string_series
+
+
+def make_df(n=1000):
+    return pd.DataFrame(
+        {
+            "url": [f"https://www.funda.nl/koop/amsterdam/huis-{i}-straat-{i}/" for i in range(n)],
+            "city": ["amsterdam", "utrecht"] * (n // 2),
+            "room": [i % 8 for i in range(n)],
+            "price": [400000 + i for i in range(n)],
+            "date_sold": pd.to_datetime(["2024-05-01"] * n),
+            "mixed": ["€ 500.000 k.k.", 650000] * (n // 2),
+        },
+    ).astype({"url": object, "city": object, "mixed": object})
+
+
+class TestDtypePolicy(object):
+    def test_dtypes(self):
+        df = apply_dtype_policy(make_df(), report=False)
+        assert df["url"].dtype.name == "string"
+        assert df["city"].dtype == "category"
+        assert df["room"].dtype == "int8"
+        assert df["price"].dtype == "int64"
+        assert df["date_sold"].dtype == "datetime64[s]"
+        # Columns mixing text and numbers must keep their numbers
+        assert df["mixed"].dtype == object
+
+    def test_values_unchanged(self):
+        before = make_df()
+        after = apply_dtype_policy(before, report=False)
+        for col in before.columns:
+            assert after[col].tolist() == before[col].tolist()
+
+    def test_fixed_integers(self):
+        # Same dtypes whatever the values, so that runs share one schema
+        small = pd.DataFrame({"living_area": [78, 90], "other": [1, 2]})
+        large = pd.DataFrame({"living_area": [78, 250], "other": [1, 2]})
+        for df in (small, large):
+            df = apply_dtype_policy(df, report=False)
+            assert df["living_area"].dtype == "int32"
+            assert df["other"].dtype == "int64"
+
+        too_large = pd.DataFrame({"room": [2, 1000]})
+        assert apply_dtype_policy(too_large, report=False)["room"].tolist() == [2, 1000]
+
+    def test_memory_report(self):
+        before = make_df()
+        report = memory_report(before, apply_dtype_policy(before, report=False))
+        assert report.loc["city", "dtype_after"] == "category"
+        assert (report["saved"] >= 0).all()
+        assert report["saved"].sum() > 0
+
+    def test_string_chunks(self, monkeypatch):
+        monkeypatch.setattr(dtypes, "STRING_CHUNK_SIZE", 7)
+        s = pd.Series(["a", None, "b€"] * 10, dtype=object, name="descrip")
+        chunked = to_string_series(s)
+        assert chunked.dtype == s.astype(dtypes.STRING_DTYPE).dtype
+        assert chunked.name == "descrip"
+        assert chunked.equals(s.astype(dtypes.STRING_DTYPE))
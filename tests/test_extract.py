@@ -0,0 +1,149 @@
+import json
+import re
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from funda_scraper.config.core import config
+from funda_scraper.extract import (
+    EXTRACTORS,
+    find_ld_json,
+    get_extractor,
+    parse_listing,
+    parse_structured_data,
+)
+from funda_scraper.preprocess import preprocess_data
+
+LINK = "https://www.funda.nl/koop/amsterdam/appartement-43000000-prinsengracht-100/"
+
+
+@pytest.fixture
+def listing_html():
+    return (Path(__file__).parent / "data" / "listing.html").read_text()
+
+
+def parse(html, backend, single_pass=False, partial=False, structured=False):
+    row = parse_listing(
+        html,
+        LINK,
+        config.css_selector.listed_since,
+        backend,
+        single_pass,
+        partial,
+        structured,
+    )
+    return dict(zip(config.css_selector.keys(), row))
+
+
+class TestParseListing(object):
+    def test_values(self, listing_html):
+        row = parse(listing_html, "bs4")
+        assert row["url"] == LINK
+        assert row["price"] == "€ 650.000 k.k."
+        assert row["listed_since"] == "3 weken"
+        assert row["living_area"] == "78 m²"
+        assert row["num_of_rooms"] == "3 kamers (2 slaapkamers)"
+        assert row["energy_label"] == "C"
+        assert row["price_sold"] == "na"
+        assert row["photo"].count("cloud.funda.nl") == 2
+
+    @pytest.mark.parametrize("backend", ["lxml", "selectolax"])
+    def test_backends_agree(self, listing_html, backend):
+        if backend == "selectolax":
+            pytest.importorskip("selectolax")
+        assert parse(listing_html, backend) == parse(listing_html, "bs4")
+
+    @pytest.mark.parametrize("backend", ["bs4", "lxml", "selectolax"])
+    def test_single_pass_agrees(self, listing_html, backend):
+        if backend == "selectolax":
+            pytest.importorskip("selectolax")
+        assert parse(listing_html, backend, single_pass=True) == parse(listing_html, "bs4")
+
+    def test_single_pass_uses_labels(self):
+        html = (
+            "<h3>Indeling</h3>"
+            "<dl class='object-kenmerken-list'>"
+            "<dt>Number of rooms</dt><dd>5 rooms (3 bedrooms)</dd>"
+            "</dl>"
+        )
+        row = parse(html, "lxml", single_pass=True)
+        assert row["num_of_rooms"] == "5 rooms (3 bedrooms)"
+        assert row["layout"] == "Number of rooms5 rooms (3 bedrooms)"
+        assert row["price"] == "na"
+
+    @pytest.mark.parametrize("single_pass", [False, True])
+    def test_partial_parse_agrees(self, listing_html, single_pass):
+        full = parse(listing_html, "bs4")
+        assert parse(listing_html, "bs4", single_pass, partial=True) == full
+
+    def test_empty_page(self):
+        for backend in EXTRACTORS:
+            assert parse("", backend)["price"] == "na"
+            assert parse("", backend, single_pass=True)["price"] == "na"
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            get_extractor("regex")
+
+
+class TestFindLdJson(object):
+    def test_first_block(self, listing_html):
+        blocks = find_ld_json(listing_html)
+        assert len(blocks) == 1
+        assert json.loads(blocks[0])["offers"]["price"] == 650000
+
+    def test_attribute_variants(self):
+        html = (
+            "<script src='x.js'></script>"
+            "<SCRIPT id='a' type='application/ld+json'>{\"a\": 1}</SCRIPT>"
+        )
+        assert find_ld_json(html) == ['{"a": 1}']
+        assert find_ld_json("<html></html>") == []
+
+
+class TestStructuredData(object):
+    def test_values(self, listing_html):
+        values = parse_structured_data(listing_html)
+        assert values["price"] == "650000"
+        assert values["living_area"] == "78"
+        assert values["year"] == "1900"
+        assert values["listed_since"] == "2023-06-30"
+        assert values["zip_code"] == "1015 EA Amsterdam"
+
+    def test_fallback_to_html(self, listing_html):
+        row = parse(listing_html, "lxml", single_pass=True, structured=True)
+        assert row["price"] == "650000"
+        assert row["energy_label"] == "C"
+        assert row["num_of_rooms"] == "3 kamers (2 slaapkamers)"
+
+    def test_same_clean_data(self, listing_html):
+        def clean(structured):
+            row = parse(listing_html, "lxml", structured=structured)
+            raw = pd.DataFrame([row], dtype=object)
+            raw["city"] = "amsterdam"
+            return preprocess_data(raw.drop(columns=["term", "price_sold", "date_sold"]), is_past=False)
+
+        structured, html = clean(True), clean(False)
+        for col in ["price", "living_area", "price_m2", "zip", "year_built", "room", "bedroom"]:
+            assert structured[col].tolist() == html[col].tolist()
+
+    def test_pages_with_and_without_ld_json(self, listing_html, tmp_path):
+        pa = pytest.importorskip("pyarrow")
+        without = re.sub(r"(?s)<script type=\"application/ld\+json\">.*?</script>", "", listing_html)
+        assert parse_structured_data(without) == {}
+
+        rows = [parse(html, "lxml", structured=True) for html in (listing_html, without)]
+        raw = pd.DataFrame(rows, dtype=object)
+        raw["city"] = "amsterdam"
+        for col in ["price", "living_area", "year"]:
+            assert pd.api.types.infer_dtype(raw[col]) == "string"
+        # One type per column, so the raw data can be stored as Parquet
+        pa.Table.from_pandas(raw)
+
+        clean = preprocess_data(raw.drop(columns=["term", "price_sold", "date_sold"]), is_past=False)
+        assert clean["price"].tolist() == [650000, 650000]
+        assert clean["living_area"].tolist() == [78, 78]
+
+    def test_no_ld_json(self):
+        assert parse_structured_data("<html></html>") == {}
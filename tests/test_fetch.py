@@ -0,0 +1,235 @@
+import asyncio
+import re
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from funda_scraper.extract import LD_JSON_PATTERN
+from funda_scraper.fetch import (
+    AdaptiveConcurrency,
+    RetryPolicy,
+    TokenBucket,
+    build_session,
+    parse_retry_after,
+    read_until,
+)
+from funda_scraper.scrape import FundaScraper
+
+
+class TestTokenBucket(object):
+    def test_burst_is_immediate(self):
+        bucket = TokenBucket(rate=1, burst=5)
+
+        async def take(n):
+            for _ in range(n):
+                await bucket.acquire()
+
+        start = time.monotonic()
+        asyncio.run(take(5))
+        assert time.monotonic() - start < 0.1
+
+    def test_rate_is_capped(self):
+        bucket = TokenBucket(rate=20, burst=1)
+
+        async def take(n):
+            await asyncio.gather(*[bucket.acquire() for _ in range(n)])
+
+        start = time.monotonic()
+        asyncio.run(take(5))
+        # The first token is available at once, the other four at 20 per second
+        assert time.monotonic() - start >= 0.19
+
+    def test_invalid_rate(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestAdaptiveConcurrency(object):
+    def test_backoff_on_throttling(self):
+        limiter = AdaptiveConcurrency(max_limit=16, cooldown=0)
+        limiter.record(429, 0.1)
+        assert int(limiter.limit) == 8
+        limiter.record(None, 0.1)
+        assert int(limiter.limit) == 4
+
+    def test_decrease_once_per_cooldown(self):
+        limiter = AdaptiveConcurrency(max_limit=16, cooldown=60)
+        limiter.record(503, 0.1)
+        limiter.record(503, 0.1)
+        assert int(limiter.limit) == 8
+
+    def test_additive_increase(self):
+        limiter = AdaptiveConcurrency(max_limit=16, min_limit=2, cooldown=0)
+        for _ in range(5):
+            limiter.record(429, 0.1)
+        assert int(limiter.limit) == 2
+        for _ in range(4):
+            limiter.record(200, 0.1)
+        assert int(limiter.limit) == 3
+
+    def test_backoff_on_latency(self):
+        limiter = AdaptiveConcurrency(max_limit=16, latency_target=1.0, cooldown=0)
+        for _ in range(10):
+            limiter.record(200, 0.1)
+        assert limiter.limit == 16
+        for _ in range(10):
+            limiter.record(200, 5.0)
+        assert limiter.limit < 16
+
+    def test_in_flight_is_capped(self):
+        limiter = AdaptiveConcurrency(max_limit=3)
+        peak = 0
+
+        async def request():
+            nonlocal peak
+            async with limiter:
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*[request() for _ in range(10)])
+
+        asyncio.run(run())
+        assert peak == 3
+        assert limiter.in_flight == 0
+
+
+class TestRetryPolicy(object):
+    def test_retryable_statuses(self):
+        policy = RetryPolicy(statuses=(429, 503))
+        assert policy.is_retryable(429)
+        assert policy.is_retryable(None)
+        assert not policy.is_retryable(404)
+
+    def test_delay_is_bounded(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+        for attempt in range(1, 10):
+            assert 0 <= policy.delay(attempt) <= 4.0
+
+    def test_delay_honours_retry_after(self):
+        policy = RetryPolicy(base_delay=0.1, max_delay=0.1)
+        assert policy.delay(1, retry_after=7) == 7
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after("12") == 12
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+        assert parse_retry_after("soon") is None
+
+
+class TestFetchRetry(object):
+    def test_retry_until_success(self):
+        calls = []
+
+        async def flaky(request):
+            calls.append(request.path)
+            if len(calls) < 3:
+                return web.Response(status=503)
+            return web.Response(text="ok")
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/", flaky)
+            async with TestServer(app) as server:
+                scraper = FundaScraper(
+                    area="amsterdam",
+                    want_to="buy",
+                    requests_per_second=None,
+                    retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.01),
+                )
+                return await scraper._fetch(str(server.make_url("/"))), scraper
+
+        text, scraper = asyncio.run(run())
+        assert text == "ok"
+        assert len(calls) == 3
+        assert scraper.failed_links == []
+
+    def test_give_up_records_failed_link(self):
+        async def down(request):
+            return web.Response(status=503, headers={"Retry-After": "0"})
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/", down)
+            async with TestServer(app) as server:
+                scraper = FundaScraper(
+                    area="amsterdam",
+                    want_to="buy",
+                    requests_per_second=None,
+                    retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01),
+                )
+                url = str(server.make_url("/"))
+                return await scraper._fetch(url), url, scraper
+
+        text, url, scraper = asyncio.run(run())
+        assert text is None
+        assert scraper.failed_links == [url]
+
+
+class TestReadUntil(object):
+    def test_search_page_stops_after_ld_json(self):
+        async def slow_page(request):
+            response = web.StreamResponse(headers={"Content-Type": "text/html"})
+            await response.prepare(request)
+            await response.write(
+                b'<html><head><script type="application/ld+json">'
+                b'{"itemListElement": [{"url": "https://www.funda.nl/koop/a/huis-1-x/"}]}'
+                b"</script></head><body>"
+            )
+            # The rest of the page would take far longer than the test allows
+            await asyncio.sleep(10)
+            await response.write(b"</body></html>")
+            return response
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/", slow_page)
+            async with TestServer(app) as server:
+                scraper = FundaScraper(
+                    area="amsterdam", want_to="buy", requests_per_second=None
+                )
+                return await asyncio.wait_for(
+                    scraper._get_links_from_one_parent(str(server.make_url("/"))), 5
+                )
+
+        start = time.monotonic()
+        assert asyncio.run(run()) == ["https://www.funda.nl/koop/a/huis-1-x/"]
+        assert time.monotonic() - start < 5
+
+    @pytest.mark.parametrize("markers", [("<script", "</script>"), None])
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64])
+    def test_match_across_chunks(self, markers, chunk_size):
+        page = (
+            "<html><head>" + "x" * 100
+            # Inline scripts before the JSON-LD, one of them left unclosed for a while
+            + "<script>var a = '<script';</script><SCRIPT src=x.js></Script>"
+            + '<script type="application/ld+json">{"a": 1}</SCRIPT><body>'
+            + "y" * 100 + "</body></html>"
+        )
+
+        async def handler(request):
+            return web.Response(text=page, content_type="text/html")
+
+        async def run():
+            app = web.Application()
+            app.router.add_get("/", handler)
+            async with TestServer(app) as server, build_session() as session:
+                url = str(server.make_url("/"))
+                texts = []
+                for pattern in (LD_JSON_PATTERN, re.compile("never")):
+                    async with session.get(url) as response:
+                        texts.append(
+                            await read_until(
+                                response, pattern, chunk_size=chunk_size, markers=markers
+                            )
+                        )
+                return texts
+
+        found, whole = asyncio.run(run())
+        # Tags split over chunks are still found, and reading stops after them
+        assert LD_JSON_PATTERN.findall(found) == ['{"a": 1}']
+        assert page.startswith(found)
+        assert len(found) < len(page)
+        assert whole == page
@@ -1,7 +1,37 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 import pytest
 
-from funda_scraper.preprocess import preprocess_data
+from funda_scraper.preprocess import (
+    clean_date_format,
+    clean_date_series,
+    clean_energy_label,
+    clean_energy_label_series,
+    clean_living_area,
+    clean_living_area_series,
+    clean_price,
+    clean_price_series,
+    clean_year,
+    clean_year_series,
+    find_n_bathroom,
+    find_n_bathroom_series,
+    find_n_bedroom,
+    find_n_bedroom_series,
+    find_n_room,
+    find_n_room_series,
+    find_keyword_from_regex,
+    normalise_series,
+    parse_layout,
+    parse_layout_frame,
+    preprocess_chunked,
+    preprocess_data,
+)
+
+RAW_VALUES = json.loads((Path(__file__).parent / "data" / "raw_values.json").read_text())
 
 
 @pytest.fixture
@@ -51,3 +81,127 @@ class TestPreprocessData:
         assert df["bedroom"].item() == 3
         # assert df["term_days"].item() == 13
         assert df["energy_label"].item() == ">A+"
+
+
+class TestVectorisedCleaning:
+    @pytest.mark.parametrize(
+        "field, scalar, vectorised",
+        [
+            ("price", clean_price, clean_price_series),
+            ("living_area", clean_living_area, clean_living_area_series),
+            ("year", clean_year, clean_year_series),
+            ("num_of_rooms", find_n_room, find_n_room_series),
+            ("num_of_rooms", find_n_bedroom, find_n_bedroom_series),
+            ("num_of_bathrooms", find_n_bathroom, find_n_bathroom_series),
+            ("energy_label", clean_energy_label, clean_energy_label_series),
+        ],
+    )
+    def test_same_as_scalar(self, field, scalar, vectorised):
+        raw = pd.Series(RAW_VALUES[field], dtype=object)
+        expected = [scalar(x) for x in raw]
+        assert vectorised(raw).tolist() == expected
+        # Columns of strings only take the fast path
+        text = raw[raw.map(lambda x: isinstance(x, str))]
+        assert vectorised(text).tolist() == [scalar(x) for x in text]
+
+    def test_house_columns_from_url(self, input_data):
+        urls = RAW_VALUES["url"]
+        df = pd.concat([input_data] * len(urls), ignore_index=True).assign(url=urls)
+        df = preprocess_data(df=df, is_past=True)
+        kept = [u for u in urls if u.split("/")[-2].split("-")[0] in ("appartement", "huis")]
+        assert df["url"].tolist() == kept
+        assert df["house_id"].tolist() == [int(u.split("/")[-2].split("-")[1]) for u in kept]
+        assert df["house_type"].tolist() == [u.split("/")[-2].split("-")[0] for u in kept]
+
+    @pytest.mark.parametrize("now", [datetime(2024, 5, 1, 12, 30), datetime(2024, 5, 5, 8)])
+    def test_dates_same_as_scalar(self, now):
+        raw = pd.Series(RAW_VALUES["date"], dtype=object)
+        expected = [clean_date_format(x, now) for x in raw]
+        expected = [pd.NaT if x == "na" else pd.Timestamp(x) for x in expected]
+        assert clean_date_series(raw, now).tolist() == expected
+
+    def test_dates_share_one_reference(self):
+        raw = pd.Series(["Vandaag", "2 weken", "vrijdag", "3 days"] * 1000)
+        result = clean_date_series(raw)
+        assert result.dtype == "datetime64[ns]"
+        assert result.nunique() == 4
+
+
+class TestLayout:
+    # The separate patterns that parse_layout replaces
+    PATTERNS = [
+        r"(\d{1,2}\s{1}kamers{0,1})|(\d{1,2}\s{1}rooms{0,1})",
+        r"(\d{1,2}\s{1}slaapkamers{0,1})|(\d{1,2}\s{1}bedrooms{0,1})",
+        r"(\d{1,2}\s{1}badkamers{0,1})|(\d{1,2}\s{1}bathrooms{0,1})",
+    ]
+
+    def test_same_as_separate_patterns(self):
+        for x in RAW_VALUES["num_of_rooms"] + RAW_VALUES["num_of_bathrooms"]:
+            expected = tuple(find_keyword_from_regex(x, p) for p in self.PATTERNS)
+            assert parse_layout(x) == expected, x
+
+    def test_memoised(self):
+        parse_layout.cache_clear()
+        for _ in range(3):
+            parse_layout("4 kamers (3 slaapkamers)")
+        assert parse_layout.cache_info().hits == 2
+
+    def test_frame(self):
+        s = pd.Series(["4 kamers (3 slaapkamers)", None, "2 badkamers", "4 kamers (3 slaapkamers)"])
+        df = parse_layout_frame(s)
+        assert df.columns.tolist() == ["room", "bedroom", "bathroom"]
+        assert df.values.tolist() == [[4, 3, 0], [0, 0, 0], [0, 0, 2], [4, 3, 0]]
+
+
+class TestNormaliseSeries:
+    def test_cleans_each_distinct_value_once(self):
+        seen = []
+
+        def clean(values):
+            seen.extend(values)
+            return clean_energy_label_series(values)
+
+        raw = pd.Series(["A+++", "B Wat betekent dit?", "A++++", None, "A+++"] * 100)
+        result = normalise_series(raw, clean)
+        assert len(seen) == 3
+        assert result.dtype == "category"
+        assert sorted(result.cat.categories) == [">A+", "B"]
+        assert result.tolist()[:5] == [">A+", "B", ">A+", np.nan, ">A+"]
+        assert result.index.equals(raw.index)
+
+    def test_not_categorical(self):
+        raw = pd.Series(["1906-1930", "2000", "1906-1930"], index=[5, 6, 7])
+        result = normalise_series(raw, clean_year_series, categorical=False)
+        assert result.tolist() == [1906, 2000, 1906]
+        assert result.index.tolist() == [5, 6, 7]
+
+    def test_preprocess_gives_categories(self, input_data):
+        df = preprocess_data(df=input_data, is_past=True)
+        assert df["energy_label"].dtype == "category"
+        assert df["building_type"].dtype == "category"
+        assert df["year_built"].item() == 2000
+
+
+class TestPreprocessChunked:
+    @pytest.fixture
+    def many_rows(self, input_data):
+        df = pd.concat([input_data] * 12, ignore_index=True)
+        df["url"] = [
+            f"https://www.funda.nl/koop/utrecht/appartement-{i}-dummy-{i}/" for i in range(12)
+        ]
+        df["price_sold"] = [f"€ {400000 + i}.000 k.k." for i in range(12)]
+        # A block without any valid row, and blocks with labels of their own
+        df.loc[4:7, "living_area"] = "na"
+        df.loc[8:, "energy_label"] = "C"
+        return df
+
+    def test_same_as_whole(self, many_rows):
+        now = datetime(2024, 5, 1)
+        whole = preprocess_data(df=many_rows, is_past=True, now=now)
+        chunked = preprocess_chunked(
+            df=many_rows, is_past=True, now=now, chunk_size=4, workers=2
+        )
+        # Rows stay in their original order
+        assert chunked["house_id"].tolist() == [0, 1, 2, 3, 8, 9, 10, 11]
+        assert chunked["energy_label"].dtype == "category"
+        pd.testing.assert_frame_equal(chunked, whole, check_categorical=False)
@@ -1,3 +1,8 @@
+import asyncio
+import json
+
+import pytest
+
 from funda_scraper.preprocess import preprocess_data
 from funda_scraper.scrape import FundaScraper
 
@@ -82,3 +87,300 @@ class TestFundaScraper(object):
         assert df.shape[0] > 12
         assert df.shape[1] == 18
         assert set(df['house_type'].unique()) == set(["appartement", "huis"])
+
+
+def fake_funda_app(n_pages=3, per_page=5, overlap=1, hits=None, in_flight=None):
+    """A local stand-in for Funda with search pages that share some listings."""
+    from aiohttp import web
+
+    hits = [] if hits is None else hits
+
+    async def search(request):
+        hits.append(request.path_qs)
+        page = int(request.query.get("search_result", 1))
+        start = (page - 1) * (per_page - overlap)
+        items = [
+            {"url": f"{request.url.origin()}/koop/amsterdam/huis-{i}-straat-{i}/"}
+            for i in range(start, start + per_page)
+        ]
+        body = json.dumps({"itemListElement": items})
+        return web.Response(
+            text=f'<html><script type="application/ld+json">{body}</script></html>',
+            content_type="text/html",
+        )
+
+    async def detail(request):
+        hits.append(request.path_qs)
+        if in_flight is not None:
+            # Hold every listing page for a moment to count the concurrent ones
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.02)
+            in_flight["now"] -= 1
+        return web.Response(
+            text='<html><div class="object-header__price">€ 500.000 k.k.</div></html>',
+            content_type="text/html",
+        )
+
+    app = web.Application()
+    app.router.add_get("/en/zoeken/koop", search)
+    app.router.add_get("/koop/{tail:.*}", detail)
+    return app
+
+
+class TestPipeline(object):
+    @pytest.mark.parametrize("parse_workers", [0, 2])
+    def test_run_overlaps_phases(self, parse_workers):
+        from aiohttp.test_utils import TestServer
+
+        async def run():
+            async with TestServer(fake_funda_app()) as server:
+                scraper = FundaScraper(
+                    area="amsterdam",
+                    want_to="buy",
+                    n_pages=3,
+                    requests_per_second=None,
+                    parse_workers=parse_workers,
+                )
+                scraper.base_url = str(server.make_url("/en"))
+                return await scraper.run(raw_data=True), scraper
+
+        df, scraper = asyncio.run(run())
+        # 3 pages of 5 listings, each sharing one listing with the previous page
+        assert len(scraper.links) == 13
+        assert df.shape == (13, 27)
+        assert df["url"].tolist() == scraper.links
+        assert df["price"].unique().tolist() == ["€ 500.000 k.k."]
+        assert df["city"].unique().tolist() == ["amsterdam"]
+
+    @pytest.mark.parametrize("adaptive", [False, True])
+    def test_in_flight_listings_are_capped(self, adaptive):
+        from aiohttp.test_utils import TestServer
+
+        in_flight = {"now": 0, "peak": 0}
+
+        async def run():
+            async with TestServer(fake_funda_app(in_flight=in_flight)) as server:
+                scraper = FundaScraper(
+                    area="amsterdam",
+                    want_to="buy",
+                    n_pages=3,
+                    max_concurrency=3,
+                    requests_per_second=None,
+                    adaptive_concurrency=adaptive,
+                )
+                scraper.base_url = str(server.make_url("/en"))
+                return await scraper.run(raw_data=True)
+
+        df = asyncio.run(run())
+        assert len(df) == 13
+        assert 1 < in_flight["peak"] <= 3
+
+    def test_worker_error_reaches_caller(self):
+        from aiohttp.test_utils import TestServer
+
+        async def run():
+            async with TestServer(fake_funda_app()) as server:
+                scraper = FundaScraper(
+                    area="amsterdam", want_to="buy", n_pages=3, requests_per_second=None
+                )
+                scraper.base_url = str(server.make_url("/en"))
+
+                async def broken(link):
+                    raise OSError("disk full")
+
+                scraper.scrape_one_link = broken
+                # Dead workers used to leave the crawl waiting forever
+                await asyncio.wait_for(scraper.run(raw_data=True), 5)
+
+        with pytest.raises(OSError, match="disk full"):
+            asyncio.run(run())
+
+    def test_sink_error_reaches_run(self, tmp_path):
+        from aiohttp.test_utils import TestServer
+
+        from tests.test_sinks import FlakySink
+
+        path = tmp_path / "listings.jsonl"
+        sink = FlakySink(str(path), batch_size=1)
+
+        async def run():
+            async with TestServer(fake_funda_app()) as server:
+                scraper = FundaScraper(
+                    area="amsterdam", want_to="buy", n_pages=3, requests_per_second=None
+                )
+                scraper.base_url = str(server.make_url("/en"))
+                try:
+                    await asyncio.wait_for(scraper.run(raw_data=True, sink=sink), 5)
+                finally:
+                    await sink.aclose()
+
+        with pytest.raises(OSError, match="disk full"):
+            asyncio.run(run())
+        assert sink.n_rows == len(path.read_text().splitlines())
+
+    def test_iter_listings(self):
+        from aiohttp.test_utils import TestServer
+
+        async def run():
+            async with TestServer(fake_funda_app()) as server:
+                scraper = FundaScraper(
+                    area="amsterdam", want_to="buy", n_pages=3, requests_per_second=None
+                )
+                scraper.base_url = str(server.make_url("/en"))
+                listings = []
+                async for listing in scraper.iter_listings(buffer_size=2):
+                    listings.append(listing)
+                return listings, scraper
+
+        listings, scraper = asyncio.run(run())
+        assert sorted(l["url"] for l in listings) == sorted(scraper.links)
+        assert len(listings[0]) == 27
+        assert "price_sold" not in listings[0]
+        assert listings[0]["city"] == "amsterdam"
+        assert scraper.raw_df.empty
+
+    def test_iter_listings_sync_stops_early(self):
+        from aiohttp.test_utils import TestServer
+
+        async def start():
+            server = TestServer(fake_funda_app())
+            await server.start_server()
+            return server
+
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(start())
+        try:
+            # The server runs in its own thread, the sync wrapper has its own loop
+            import threading
+
+            thread = threading.Thread(target=loop.run_forever, daemon=True)
+            thread.start()
+            scraper = FundaScraper(
+                area="amsterdam", want_to="buy", n_pages=3, requests_per_second=None
+            )
+            scraper.base_url = str(server.make_url("/en"))
+            listings = scraper.iter_listings_sync(buffer_size=1)
+            first = next(listings)
+            listings.close()
+            assert first["url"] in scraper.links
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.run_until_complete(server.close())
+            loop.close()
+
+    def test_resume_from_checkpoint(self, tmp_path):
+        from aiohttp.test_utils import TestServer
+
+        hits = []
+
+        async def run():
+            async with TestServer(fake_funda_app(hits=hits)) as server:
+                results = []
+                for resume in (False, True):
+                    scraper = FundaScraper(
+                        area="amsterdam",
+                        want_to="buy",
+                        n_pages=3,
+                        requests_per_second=None,
+                        checkpoint_path=str(tmp_path / "checkpoint.db"),
+                    )
+                    scraper.base_url = str(server.make_url("/en"))
+                    results.append(await scraper.run(raw_data=True, resume=resume))
+                    results.append(len(hits))
+                return results
+
+        first, n_first, second, n_second = asyncio.run(run())
+        # Everything comes from the checkpoint, so no request is sent again
+        assert n_first == 3 + 13
+        assert n_second == n_first
+        first = first.drop(columns="log_id").sort_values("url", ignore_index=True)
+        second = second.drop(columns="log_id").sort_values("url", ignore_index=True)
+        assert second.equals(first)
+
+    def test_iter_listings_starts_checkpoint_afresh(self, tmp_path):
+        from aiohttp.test_utils import TestServer
+
+        hits = []
+
+        async def run():
+            async with TestServer(fake_funda_app(hits=hits)) as server:
+                counts = []
+                for resume in (False, False, True):
+                    scraper = FundaScraper(
+                        area="amsterdam",
+                        want_to="buy",
+                        n_pages=3,
+                        requests_per_second=None,
+                        checkpoint_path=str(tmp_path / "checkpoint.db"),
+                    )
+                    scraper.base_url = str(server.make_url("/en"))
+                    listings = [l async for l in scraper.iter_listings(resume=resume)]
+                    counts.append((len(listings), len(hits)))
+                return counts
+
+        first, second, resumed = asyncio.run(run())
+        # A crawl that does not resume sends every request again
+        assert first == (13, 3 + 13)
+        assert second == (13, 2 * (3 + 13))
+        assert resumed == (13, 2 * (3 + 13))
+
+    def test_checkpoint_errors_are_logged(self, tmp_path):
+        import sqlite3
+
+        from aiohttp.test_utils import TestServer
+
+        async def run():
+            async with TestServer(fake_funda_app()) as server:
+                scraper = FundaScraper(
+                    area="amsterdam",
+                    want_to="buy",
+                    n_pages=3,
+                    requests_per_second=None,
+                    checkpoint_path=str(tmp_path / "checkpoint.db"),
+                )
+                scraper.base_url = str(server.make_url("/en"))
+
+                def locked(url):
+                    raise sqlite3.OperationalError("database is locked")
+
+                scraper.checkpoint.get_row = locked
+                return await asyncio.wait_for(scraper.run(raw_data=True), 5), scraper
+
+        df, scraper = asyncio.run(run())
+        # Every listing failed on its lookup, without stopping the crawl
+        assert len(scraper.links) == 13
+        assert df.empty
+
+    def test_partial_parse_needs_bs4(self, caplog):
+        FundaScraper(area="amsterdam", want_to="buy", partial_parse=True, parser_backend="bs4")
+        assert "partial_parse" not in caplog.text
+        FundaScraper(area="amsterdam", want_to="buy", partial_parse=True, parser_backend="lxml")
+        assert "no effect with lxml" in caplog.text
+
+    def test_resume_requires_checkpoint(self):
+        scraper = FundaScraper(area="amsterdam", want_to="buy")
+        with pytest.raises(ValueError):
+            next(scraper.iter_listings_sync(resume=True))
+
+    def test_write_listings(self, tmp_path):
+        from aiohttp.test_utils import TestServer
+
+        from funda_scraper.sinks import JsonlSink
+
+        path = tmp_path / "listings.jsonl"
+
+        async def run():
+            async with TestServer(fake_funda_app()) as server:
+                scraper = FundaScraper(
+                    area="amsterdam", want_to="buy", n_pages=3, requests_per_second=None
+                )
+                scraper.base_url = str(server.make_url("/en"))
+                sink = JsonlSink(str(path), batch_size=4)
+                return await scraper.write_listings(sink, buffer_size=2), scraper
+
+        n_rows, scraper = asyncio.run(run())
+        listings = [json.loads(line) for line in path.read_text().splitlines()]
+        assert n_rows == len(listings) == 13
+        assert sorted(l["url"] for l in listings) == sorted(scraper.links)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pandas as pd
+import pytest
+
+from funda_scraper.sinks import CsvSink, JsonlSink, ParquetSink, open_sink
+
+
+def listing(i):
+    return {"url": f"https://www.funda.nl/koop/amsterdam/huis-{i}/", "price": f"€ {i}00.000"}
+
+
+class FlakySink(JsonlSink):
+    """A JSON lines sink whose first batch fails to be written."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self.failures = 1
+
+    def _write_rows(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        super()._write_rows(rows)
+
+
+class TestSinks(object):
+    def test_flushes_every_batch(self, tmp_path):
+        path = tmp_path / "listings.jsonl"
+        sink = JsonlSink(str(path), batch_size=2, flush_interval=3600)
+        for i in range(3):
+            sink.write(listing(i))
+        # The third listing waits for the next batch
+        assert len(path.read_text().splitlines()) == 2
+        sink.close()
+        assert [json.loads(line) for line in path.read_text().splitlines()] == [
+            listing(i) for i in range(3)
+        ]
+        assert sink.n_rows == 3
+
+    def test_flushes_after_interval(self, tmp_path):
+        path = tmp_path / "listings.jsonl"
+        with JsonlSink(str(path), batch_size=100, flush_interval=0) as sink:
+            sink.write(listing(0))
+            assert len(path.read_text().splitlines()) == 1
+
+    def test_timer_flushes_idle_buffer(self, tmp_path):
+        path = tmp_path / "listings.jsonl"
+
+        async def run():
+            async with JsonlSink(str(path), batch_size=100, flush_interval=0.1) as sink:
+                await sink.awrite(listing(0))
+                assert not path.exists()
+                # No further listing comes in, the timer flushes on its own
+                await asyncio.sleep(0.3)
+                lines = path.read_text().splitlines()
+                await sink.awrite(listing(1))
+            return lines, sink
+
+        lines, sink = asyncio.run(run())
+        assert [json.loads(line) for line in lines] == [listing(0)]
+        assert len(path.read_text().splitlines()) == 2
+        assert sink._timer is None
+
+    def test_failed_batch_is_not_counted(self, tmp_path):
+        path = tmp_path / "listings.jsonl"
+        sink = FlakySink(str(path), batch_size=1, flush_interval=3600)
+        with pytest.raises(OSError):
+            sink.write(listing(0))
+        sink.write(listing(1))
+        sink.close()
+        assert sink.n_rows == len(path.read_text().splitlines()) == 1
+
+    def test_timer_error_is_raised(self, tmp_path):
+        path = tmp_path / "listings.jsonl"
+
+        async def run():
+            async with FlakySink(str(path), batch_size=100, flush_interval=0.05) as sink:
+                await sink.awrite(listing(0))
+                await asyncio.sleep(0.2)
+            return sink
+
+        with pytest.raises(OSError):
+            asyncio.run(run())
+
+    def test_csv_appends_with_one_header(self, tmp_path):
+        path = str(tmp_path / "out" / "listings.csv")
+        for start in (0, 3):
+            with CsvSink(path, batch_size=2) as sink:
+                for i in range(start, start + 3):
+                    sink.write(listing(i))
+        df = pd.read_csv(path)
+        assert df["url"].tolist() == [listing(i)["url"] for i in range(6)]
+
+    def test_parquet_writes_one_file_per_batch(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        path = tmp_path / "listings.parquet"
+
+        async def write():
+            async with ParquetSink(str(path), batch_size=2) as sink:
+                for i in range(5):
+                    await sink.awrite(listing(i))
+
+        asyncio.run(write())
+        assert len(list(path.glob("*.parquet"))) == 3
+        df = pd.read_parquet(path)
+        assert sorted(df["url"]) == sorted(listing(i)["url"] for i in range(5))
+
+    def test_open_sink(self, tmp_path):
+        sinks = [
+            open_sink(str(tmp_path / "a.csv")),
+            open_sink(str(tmp_path / "a.jsonl")),
+            open_sink(str(tmp_path / "a"), file_format="csv"),
+        ]
+        assert [type(sink) for sink in sinks] == [CsvSink, JsonlSink, CsvSink]
+        for sink in sinks:
+            sink.close()
+        with pytest.raises(ValueError):
+            open_sink(str(tmp_path / "a.xlsx"))
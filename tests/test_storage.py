@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from funda_scraper.storage import read_parquet, write_parquet
+
+pytest.importorskip("pyarrow")
+
+
+def make_df(city, n=3):
+    return pd.DataFrame(
+        {
+            "url": [f"https://www.funda.nl/koop/{city}/huis-{i}/" for i in range(n)],
+            "price": [100000 * (i + 1) for i in range(n)],
+            "date_list": pd.to_datetime(["2024-01-01"] * n),
+            "city": city,
+        }
+    )
+
+
+class TestParquetStorage(object):
+    def test_partitioned_layout(self, tmp_path):
+        write_parquet(make_df("amsterdam"), str(tmp_path), "buy", date="2024-05-01")
+        files = [p.relative_to(tmp_path).parent.as_posix() for p in tmp_path.rglob("*.parquet")]
+        assert files == ["city=amsterdam/want_to=buy/date=2024-05-01"]
+
+    def test_read_filters_partitions_and_keeps_dtypes(self, tmp_path):
+        write_parquet(make_df("amsterdam"), str(tmp_path), "buy", date="2024-05-01")
+        write_parquet(make_df("utrecht", 2), str(tmp_path), "buy", date="2024-05-01")
+        write_parquet(make_df("amsterdam", 4), str(tmp_path), "rent", date="2024-05-02")
+
+        df = read_parquet(str(tmp_path), city="amsterdam", want_to="buy")
+        assert len(df) == 3
+        assert df["city"].unique().tolist() == ["amsterdam"]
+        assert pd.api.types.is_datetime64_any_dtype(df["date_list"])
+        assert pd.api.types.is_integer_dtype(df["price"])
+
+        assert len(read_parquet(str(tmp_path), date=["2024-05-01", "2024-05-02"])) == 9
+        assert read_parquet(str(tmp_path), columns=["url"]).columns.tolist() == ["url"]
+
+    def test_writes_append(self, tmp_path):
+        for _ in range(2):
+            write_parquet(make_df("amsterdam"), str(tmp_path), "buy", date="2024-05-01")
+        assert len(read_parquet(str(tmp_path))) == 6
+
+    def test_runs_with_other_ranges(self, tmp_path):
+        from funda_scraper.dtypes import apply_dtype_policy
+
+        for living_area in ([78, 90], [78, 250]):
+            df = make_df("amsterdam", 2).assign(living_area=living_area)
+            df = apply_dtype_policy(df, report=False)
+            write_parquet(df, str(tmp_path), "buy", date="2024-05-01")
+
+        df = read_parquet(str(tmp_path))
+        assert sorted(df["living_area"].tolist()) == [78, 78, 90, 250]
+
+    def test_row_group_size(self, tmp_path):
+        import pyarrow.parquet as pq
+
+        write_parquet(
+            make_df("amsterdam", 10), str(tmp_path), "buy", compression="zstd", row_group_size=4
+        )
+        (path,) = tmp_path.rglob("*.parquet")
+        metadata = pq.ParquetFile(path).metadata
+        assert metadata.num_row_groups == 3
+        assert metadata.row_group(0).column(0).compression == "ZSTD"
@@ -0,0 +1,19 @@
+import argparse
+
+import pytest
+
+from funda_scraper.utils import str_to_bool
+
+
+class TestStrToBool(object):
+    @pytest.mark.parametrize("value", ["True", "true", "yes", "1", "on"])
+    def test_true(self, value):
+        assert str_to_bool(value) is True
+
+    @pytest.mark.parametrize("value", ["False", "false", "no", "0", "off"])
+    def test_false(self, value):
+        assert str_to_bool(value) is False
+
+    def test_invalid(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            str_to_bool("maybe")